@@ -0,0 +1,216 @@
+import argparse
+import gc
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import numpy as np
+from checkerboard_wfc import CheckerGen
+from octboard_wfc import OctCheckerGen
+from sudoku import Sudoku
+from pipe_wfc import PipeGen as PipeGen1
+from pipe_wfc2 import PipeGen as PipeGen2
+
+# reproducible timings of the bundled generators: graph build, save_initial, solve, restarts and peak memory
+# per generator, size and seed (each the fastest of a few repeats), written as JSON and optionally compared against
+# a stored baseline run
+#   python benchmark.py --mode bitset --output bench.json
+#   python benchmark.py --mode bitset --baseline bench.json
+#   python benchmark.py --mode bitset --kernel python    (the reference solve loop instead of the numba one)
+# classic mode pops nodes out of sets of name strings, so its timings also depend on PYTHONHASHSEED
+
+SIZES = {
+    'quick': {
+        'checker': [(30, 30)],
+        'octchecker': [(20, 20)],
+        'sudoku': [4, 9],
+        'pipe': [(20, 20)],
+        'pipe2': [(10, 10)],
+    },
+    'default': {
+        'checker': [(50, 50), (100, 100), (200, 200)],
+        'octchecker': [(20, 20), (50, 50), (100, 100)],
+        'sudoku': [4, 9, 16],
+        'pipe': [(20, 20), (50, 50)],
+        'pipe2': [(20, 20), (50, 50)],
+    },
+}
+
+GENERATORS = {
+    'checker': CheckerGen,
+    'octchecker': OctCheckerGen,
+    'sudoku': Sudoku,
+    'pipe': PipeGen1,
+    'pipe2': PipeGen2,
+}
+
+METRICS = ('build_s', 'save_initial_s', 'solve_s')
+
+# a phase only counts as a regression once it is this much slower in absolute terms too, below that the
+# difference is scheduler and cache noise
+NOISE_FLOOR_S = 0.01
+
+# memory budget of a solved bitset mode 4-neighbor grid with "row,col" names, counting everything the solver keeps
+# (name table, CSR adjacency, domains, the initial snapshot and the bucket queue); roughly half of it is the names
+BYTES_PER_NODE_TARGET = 240
+
+def build(generator:str, size, wfc_options:dict):
+    return GENERATORS[generator](size, **wfc_options)
+
+def warm_up(generator:str, size, wfc_options:dict):
+    # one untimed solve, so loading (or compiling) the numba kernel for this kind of graph, filling the rule cache
+    # and the first numpy calls are not timed as part of the first case
+    gen = build(generator, size, dict(wfc_options, seed=0))
+    gen.wfc.solve()
+
+def run_case(generator:str, size, seed:int, wfc_options:dict, max_restarts:'int|None') -> dict:
+    # the generators call save_initial() while building, so save_initial is timed again on the built graph
+    random.seed(seed)
+    options = dict(wfc_options, seed=seed)
+    gc.collect()
+    start = time.perf_counter()
+    gen = build(generator, size, options)
+    built = time.perf_counter()
+    gen.wfc.save_initial()
+    saved = time.perf_counter()
+    solved = gen.wfc.solve(max_restarts)
+    end = time.perf_counter()
+    return {
+        'build_s': built - start,
+        'save_initial_s': saved - built,
+        'solve_s': end - saved,
+        'restarts': gen.wfc.restarts,
+        'solved': solved,
+    }
+
+def peak_memory(generator:str, size, seed:int, wfc_options:dict, max_restarts:'int|None') -> int:
+    # separate traced run, tracemalloc slows numpy allocations down too much to share the timed one
+    random.seed(seed)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        gen = build(generator, size, dict(wfc_options, seed=seed))
+        gen.wfc.solve(max_restarts)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def bytes_per_node(size:'tuple[int,int]'=(300, 300), kernel:str='python') -> float:
+    # traced memory held by a solved bitset mode CheckerGen, per node; the warm-up solve keeps what is loaded once
+    # per process (the numba dispatcher, the rule cache) out of the count
+    CheckerGen((8, 8), mode='bitset', seed=0, kernel=kernel).wfc.solve()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        gen = CheckerGen(size, mode='bitset', seed=0, kernel=kernel)
+        gen.wfc.solve()
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0] / (size[0] * size[1])
+    finally:
+        tracemalloc.stop()
+
+def case_name(generator:str, size) -> str:
+    return "%s/%s" % (generator, "x".join(map(str, size)) if type(size) == tuple else size)
+
+def best_case(generator:str, size, seed:int, wfc_options:dict, max_restarts:'int|None', repeats:int) -> dict:
+    # the same seeded case run repeats times, keeping the fastest time of every phase: noise only ever adds time
+    runs = [run_case(generator, size, seed, wfc_options, max_restarts) for _ in range(repeats)]
+    return dict(runs[0], **{metric: min(r[metric] for r in runs) for metric in METRICS})
+
+def run(sizes:dict, seeds:'list[int]', wfc_options:dict, max_restarts:'int|None', memory:bool=True,
+        repeats:int=3) -> dict:
+    cases = dict()
+    for generator, generator_sizes in sizes.items():
+        warm_up(generator, generator_sizes[0], wfc_options)
+        for size in generator_sizes:
+            runs = [best_case(generator, size, seed, wfc_options, max_restarts, repeats) for seed in seeds]
+            case = {metric: statistics.median(r[metric] for r in runs) for metric in METRICS}
+            case['restarts'] = [r['restarts'] for r in runs]
+            case['solved'] = all(r['solved'] for r in runs)
+            if memory:
+                case['peak_bytes'] = peak_memory(generator, size, seeds[0], wfc_options, max_restarts)
+            cases[case_name(generator, size)] = case
+            print("%-20s build %8.4fs  save_initial %8.4fs  solve %8.4fs  restarts %s%s" % (
+                case_name(generator, size), case['build_s'], case['save_initial_s'], case['solve_s'],
+                case['restarts'], "  peak %.1f MiB" % (case['peak_bytes'] / 2 ** 20) if memory else ""))
+    return {
+        'options': wfc_options,
+        'seeds': seeds,
+        'repeats': repeats,
+        'max_restarts': max_restarts,
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cases': cases,
+    }
+
+def compare(result:dict, baseline:dict, tolerance:float, noise_floor:float=NOISE_FLOOR_S) -> 'list[str]':
+    # cases whose median time of any phase grew by more than tolerance (0.25 is 25%) over the baseline and by more
+    # than noise_floor seconds
+    regressions = []
+    for name, case in result['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            continue
+        for metric in METRICS:
+            if case[metric] > base[metric] * (1 + tolerance) and case[metric] - base[metric] > noise_floor:
+                regressions.append("%s %s %.4fs -> %.4fs (%+.0f%%)" % (
+                    name, metric, base[metric], case[metric], 100 * (case[metric] / base[metric] - 1)))
+        if 'peak_bytes' in case and 'peak_bytes' in base and case['peak_bytes'] > base['peak_bytes'] * (1 + tolerance):
+            regressions.append("%s peak_bytes %d -> %d" % (name, base['peak_bytes'], case['peak_bytes']))
+    return regressions
+
+def main(argv:'list[str]|None'=None) -> int:
+    parser = argparse.ArgumentParser(description="benchmark the bundled WaveFunctionCollapse generators")
+    parser.add_argument('--mode', choices=('classic', 'bitset'), default='classic')
+    parser.add_argument('--propagation', choices=('neighbor', 'ac3'), default='neighbor')
+    parser.add_argument('--kernel', choices=('auto', 'python', 'numba'), default='auto', help="bitset mode solve loop")
+    parser.add_argument('--sizes', choices=tuple(SIZES), default='default')
+    parser.add_argument('--only', nargs='+', choices=tuple(GENERATORS), help="only run these generators")
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0, 1, 2])
+    parser.add_argument('--repeats', type=int, default=3, help="time every seed this many times, keep the fastest")
+    parser.add_argument('--max-restarts', type=int, default=1000, help="give up on a solve after this many restarts")
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced memory runs")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="JSON file of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown over the baseline")
+    parser.add_argument('--noise-floor', type=float, default=NOISE_FLOOR_S,
+                        help="seconds a phase may grow by before it can count as a regression")
+    args = parser.parse_args(argv)
+    if args.mode == 'classic' and args.propagation != 'neighbor':
+        parser.error("--propagation %s requires --mode bitset" % (args.propagation,))
+    if args.mode == 'classic' and args.kernel == 'numba':
+        parser.error("--kernel numba requires --mode bitset")
+    if args.repeats < 1:
+        parser.error("--repeats must be at least 1")
+
+    sizes = SIZES[args.sizes]
+    if args.only:
+        sizes = {generator: sizes[generator] for generator in args.only}
+    wfc_options = {'mode': args.mode, 'propagation': args.propagation, 'kernel': args.kernel}
+    result = run(sizes, args.seeds, wfc_options, args.max_restarts, not args.no_memory, args.repeats)
+    failed = False
+    if not args.no_memory:
+        result['bytes_per_node'] = bytes_per_node(kernel=args.kernel)
+        failed = result['bytes_per_node'] > BYTES_PER_NODE_TARGET
+        print("bitset memory %.0f bytes/node (target %d)%s" % (
+            result['bytes_per_node'], BYTES_PER_NODE_TARGET, "  OVER TARGET" if failed else ""))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('options') != result['options']:
+            print("warning: baseline was run with %r" % (baseline.get('options'),))
+        regressions = compare(result, baseline, args.tolerance, args.noise_floor)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
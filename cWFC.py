@@ -1,26 +1,214 @@
 from heapq import *
+import asyncio
+from collections.abc import Mapping
+from collections import deque
+from typing import Callable, Iterable
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, repeat
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+import os
+import json
+import hashlib
+import pickle
 import random
-import copy
+import warnings
+import numpy as np
+import wfc_kernel
+
+WORD_BITS = 64
+WORD_MASK = (1 << WORD_BITS) - 1
+
+# per solve() statistics, times are in seconds
+STAT_COUNTERS = ('collapses', 'removals', 'contradictions', 'restarts', 'backtracks', 'queue_moves',
+                 'collapse_s', 'propagate_s', 'restart_s')
+EVENTS = ('collapse', 'contradiction', 'backtrack', 'restart', 'solve')
+
+# the mode the generators default to: bitset where the numba kernel solves it, classic where the python loops would
+KERNEL_MODE = 'bitset' if wfc_kernel.numba is not None else 'classic'
+
+# compiled rule tables are shared by every bitset solver over the same rules, for the last RULE_CACHE_SIZE rule sets
+RULE_CACHE_SIZE = 32
+_rule_cache:'dict[str,dict]' = dict()
+
+# problem files: magic, uint64 header length, JSON header, then 64 byte aligned raw arrays
+PROBLEM_MAGIC = b'WFCPROB1'
+PROBLEM_ALIGN = 64
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(words:np.ndarray) -> np.ndarray:
+        # number of set bits along the last axis of a uint64 word array
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _BYTE_POPCOUNT = np.array([bin(b).count('1') for b in range(256)], dtype=np.uint8)
+
+    def popcount(words:np.ndarray) -> np.ndarray:
+        words = np.ascontiguousarray(words)
+        bytes_view = words.view(np.uint8).reshape(words.shape[:-1] + (-1,))
+        return _BYTE_POPCOUNT[bytes_view].sum(axis=-1, dtype=np.int64)
+
+def state_mask(indices:'list[int]', num_words:int) -> np.ndarray:
+    # bitmask row with the given state indices set
+    mask = np.zeros(num_words, dtype=np.uint64)
+    for i in indices:
+        mask[i // WORD_BITS] |= np.uint64(1 << (i % WORD_BITS))
+    return mask
+
+def pack_masks(matrix:np.ndarray, num_words:int) -> np.ndarray:
+    # (..., S) boolean matrix -> (..., num_words) uint64 bitmask rows, state i is bit i
+    padded = np.zeros(matrix.shape[:-1] + (num_words * WORD_BITS,), dtype=bool)
+    padded[..., :matrix.shape[-1]] = matrix
+    packed = np.packbits(padded, axis=-1, bitorder='little')
+    return np.ascontiguousarray(packed).view('<u8').astype(np.uint64)
+
+def unpack_masks(rows:np.ndarray, num_states:int) -> np.ndarray:
+    # (..., num_words) bitmask rows -> (..., S) boolean matrix, the inverse of pack_masks
+    states = np.arange(num_states)
+    return ((rows[..., states // WORD_BITS] >> (states % WORD_BITS).astype(np.uint64)) & np.uint64(1)).astype(bool)
+
+def support_table(masks:np.ndarray, num_states:int) -> 'tuple[np.ndarray,np.ndarray]':
+    # precomputed unions of masks[k, s] for every value of every byte of a domain row, so the union over the
+    # states of a domain is one lookup per byte; masks is (kinds, S, num_words), returns the native byte
+    # positions holding state bits and a (positions, 256, kinds, num_words) table
+    num_kinds, _, num_words = masks.shape
+    probe = state_mask(range(num_states), num_words).view(np.uint8)
+    positions = np.flatnonzero(probe)
+    table = np.zeros((len(positions), 256, num_kinds, num_words), dtype=np.uint64)
+    values = np.arange(256, dtype=np.uint8)
+    for chunk, position in enumerate(positions.tolist()):
+        for s in range(num_states):
+            byte = state_mask([s], num_words).view(np.uint8)[position]
+            if byte:
+                table[chunk, (values & byte) != 0] |= masks[:, s]
+    return positions, table
+
+def weight_tables(weights:'list[float]', num_words:int, positions:np.ndarray) -> 'tuple[list,list]':
+    # for every byte position holding state bits (as from support_table) and every value of that byte: the total
+    # weight of the states it sets, and their cumulative weights and state indices in bit order, so a weighted
+    # draw from a domain row is a walk over its bytes and one bisect
+    totals, tables = [], []
+    for position in positions.tolist():
+        members = [(s, int(state_mask([s], num_words).view(np.uint8)[position])) for s in range(len(weights))]
+        members = [(s, bit) for s, bit in members if bit]
+        chunk_totals, chunk_tables = [], []
+        for value in range(256):
+            states = tuple(s for s, bit in members if value & bit)
+            cumulative = tuple(accumulate(weights[s] for s in states))
+            chunk_totals.append(cumulative[-1] if cumulative else 0.0)
+            chunk_tables.append((cumulative, states))
+        totals.append(chunk_totals)
+        tables.append(chunk_tables)
+    return totals, tables
+
+def rule_key(states:'list[str]', adjacencyAllow:'dict[str,list[str]]', labelAllow:'dict[str,dict[str,list[str]]]') -> str:
+    # sha1 of the rules in a canonical JSON form, the order of the allowed lists does not matter
+    canonical = lambda rules: sorted((state, sorted(adj_states)) for state, adj_states in rules.items())
+    key = [states, canonical(adjacencyAllow), sorted((label, canonical(rules)) for label, rules in labelAllow.items())]
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+def compile_rules(states:'list[str]', adjacencyAllow:'dict[str,list[str]]', labelAllow:'dict[str,dict[str,list[str]]]') -> dict:
+    # rule tables of the bitset mode plus an analysis of the states, cached under rule_key(); the arrays are read-only
+    # as every solver over the same rules shares them
+    key = rule_key(states, adjacencyAllow, labelAllow)
+    if key in _rule_cache:
+        return _rule_cache[key]
+    state_index = {state: i for i, state in enumerate(states)}
+    num_states = len(states)
+    num_words = max(1, -(-num_states // WORD_BITS))
+    # every arc has a kind: 0 for unlabelled edges, then a forward and a reverse kind per label
+    # compatible[k, s, t] is True when a neighbor across an arc of kind k from a node in state s may be in state t
+    compatible = np.ones((1 + 2 * len(labelAllow), num_states, num_states), dtype=bool)
+    for kind, rules in enumerate([adjacencyAllow] + list(labelAllow.values())):
+        kind = 2 * kind - 1 if kind else 0
+        for state, adj_states in rules.items():
+            compatible[kind, state_index[state]] = False
+            compatible[kind, state_index[state], [state_index[adj] for adj in adj_states]] = True
+        if kind:
+            compatible[kind + 1] = compatible[kind].T
+    # allow_masks[k, s] is the set of states a neighbor across an arc of kind k may keep once a node collapses to s
+    allow_masks = pack_masks(compatible, num_words)
+    support_bytes, table = support_table(allow_masks, num_states)
+    # both ends of an unlabelled edge must allow each other, so pruning uses the rule table and its transpose at once;
+    # a label's reverse kind already is the transpose of its forward kind
+    consistent = compatible.copy()
+    consistent[0] &= compatible[0].T
+    prune_table = table if (consistent == compatible).all() else support_table(pack_masks(consistent, num_words), num_states)[1]
+
+    # swapping states s and t maps every table onto itself when their rows agree outside columns s and t, their
+    # columns outside rows s and t, and the entries among the two do too; states with the very same rows and
+    # columns are equivalent, any solution stays one with them exchanged
+    ints = compatible.astype(np.int64)
+    differ_rows = (ints @ (1 - ints).transpose(0, 2, 1) + (1 - ints) @ ints.transpose(0, 2, 1)).sum(axis=0)
+    differ_cols = (ints.transpose(0, 2, 1) @ (1 - ints) + (1 - ints).transpose(0, 2, 1) @ ints).sum(axis=0)
+    diagonal = compatible[:, np.arange(num_states), np.arange(num_states)]
+    self_differs = (diagonal[:, :, None] != compatible.transpose(0, 2, 1)).sum(axis=0) # [s, t]: C[s, s] != C[t, s]
+    across_differs = (compatible != diagonal[:, None, :]).sum(axis=0) # [s, t]: C[s, t] != C[t, t]
+    outside_rows = differ_rows - self_differs - across_differs
+    outside_cols = differ_cols - self_differs.T - across_differs.T
+    swappable = ((outside_rows == 0) & (outside_cols == 0) & (diagonal[:, :, None] == diagonal[:, None, :]).all(axis=0)
+                 & (compatible == compatible.transpose(0, 2, 1)).all(axis=0))
+    symmetric = [(states[a], states[b]) for a, b in zip(*np.nonzero(np.triu(swappable, 1)))]
+    classes = dict()
+    for s in range(num_states):
+        classes.setdefault(compatible[:, s].tobytes() + compatible[:, :, s].tobytes(), []).append(states[s])
+    rules = {
+        'compatible': compatible,
+        'allow_masks': allow_masks,
+        'support_bytes': support_bytes,
+        'support_table': table,
+        'prune_table': prune_table,
+        # unsupported[k, s]: no state of a neighbor across an arc of kind k goes with s, a node with such an arc can
+        # never take it
+        'unsupported': ~consistent.any(axis=2),
+        'equivalent': [group for group in classes.values() if len(group) > 1],
+        'symmetric': symmetric,
+    }
+    for name in ('compatible', 'allow_masks', 'support_bytes', 'support_table', 'prune_table', 'unsupported'):
+        rules[name].flags.writeable = False
+    if len(_rule_cache) >= RULE_CACHE_SIZE:
+        del _rule_cache[next(iter(_rule_cache))]
+    _rule_cache[key] = rules
+    return rules
+
+def mask_indices(row:np.ndarray) -> 'list[int]':
+    # state indices set in a bitmask row
+    indices = []
+    for w, word in enumerate(row.tolist()):
+        while word:
+            low = word & -word
+            indices.append(w * WORD_BITS + low.bit_length() - 1)
+            word ^= low
+    return indices
 
 class Node:
-    def __init__(self, name:str, states:'list[str]', assign:'str|tuple[str]|None'=None, priority_modifier:int=0):
-        states = states.copy()
-        self.possible_states:dict[str,bool] = dict()
+    # node of the classic mode, its remaining states are the bits of an int over a state -> bit table
+    # shared by every node of the solver
+    __slots__ = ('name', 'states', 'mask', 'collapsed', 'state_count', 'priority_modifier', 'weights')
+
+    def __init__(self, name:str, states:'list[str]|dict[str,int]', assign:'str|tuple[str]|None'=None,
+                 priority_modifier:int=0, weights:'dict[str,float]|None'=None):
+        if type(states) != dict:
+            states = {state: 1 << i for i, state in enumerate(states)}
+        self.states:dict[str,int] = states
+        self.mask = 0
         if type(assign) == tuple:
-            for s in states:
-                self.possible_states[s] = False
             for s in assign:
-                self.possible_states[s] = True
-        else:
-            for s in states:
-                self.possible_states[s] = (assign is None)
+                self.mask |= states[s]
+        elif assign is None:
+            self.mask = (1 << len(states)) - 1
         self.collapsed:str|None = (assign if type(assign) == str else None)
         self.state_count:int = len(assign) if (type(assign) == tuple) else len(states)
         self.priority_modifier:int = priority_modifier
         self.name = name
-    
+        self.weights = weights # shared with the solver, None picks uniformly
+
+    @property
+    def possible_states(self) -> 'dict[str,bool]':
+        return {state: bool(self.mask & bit) for state, bit in self.states.items()}
+
     def num_states(self) -> int:
-        return self.state_count + self.priority_modifier + (0 if self.collapsed is None else len(self.possible_states))
+        return self.state_count + self.priority_modifier + (0 if self.collapsed is None else len(self.states))
     
     def update_possible_states(self, state:str) -> bool:
         # returns True if the possible state is updated, otherwise false
@@ -28,26 +216,37 @@ class Node:
         if self.collapsed is not None:
             return False
 
-        prev_possible = self.possible_states[state]
-        self.possible_states[state] = False
-        if prev_possible:
-            self.state_count -= 1
-            assert self.state_count > 0
-        return prev_possible
+        bit = self.states[state]
+        if not self.mask & bit:
+            return False
+        self.mask ^= bit
+        self.state_count -= 1
+        assert self.state_count > 0
+        return True
     
     def collapse(self) -> bool:
         if self.collapsed is not None:
             return False
         
         assert self.state_count > 0
-        
-        possible_states:list[str] = []
-        for state, possible in self.possible_states.items():
-            if possible:
-                possible_states.append(state)
-                self.possible_states[state] = False
-        
-        self.collapsed = possible_states[random.randrange(len(possible_states))]
+
+        # draw a point on the total weight of the remaining states, then walk to the one it hits
+        weights = self.weights
+        total = 0 if weights is None else sum(weights[s] for s, bit in self.states.items() if self.mask & bit)
+        if total == 0:
+            # no weights, or only states of weight 0 left that the weights do not tell apart
+            weights = None
+            pick = random.randrange(self.state_count)
+        else:
+            pick = random.random() * total
+        for state, bit in self.states.items():
+            if self.mask & bit:
+                self.collapsed = state # float rounding may run past the last state, which is then kept
+                weight = 1 if weights is None else weights[state]
+                if pick < weight:
+                    break
+                pick -= weight
+        self.mask = 0
         return True
 
     def __lt__(self, node:'Node'):
@@ -93,37 +292,533 @@ class NodeSort:
     def empty(self):
         return len(self.node_bucket) == 0
 
+    def snapshot(self) -> tuple:
+        return self.node_bucket.copy(), tuple(bucket.copy() for bucket in self.buckets)
+
+    def restore(self, snapshot:tuple):
+        node_bucket, buckets = snapshot
+        self.node_bucket = node_bucket.copy()
+        self.buckets = tuple(bucket.copy() for bucket in buckets)
+
+
+class IndexSort:
+    # same bucket queue as NodeSort, keyed by integer node ids for the bitset mode
+    # every bucket is a doubly linked list threaded through flat arrays, so the whole queue is saved
+    # and restored with a few buffer copies
+    def __init__(self, num_states:int):
+        self.num_states = num_states
+        # C ints keep the queue (and each of its snapshots) at 12 bytes per node
+        self.heads = array('i', [-1] * (num_states + 1)) # first node of each bucket
+        self.next = array('i')
+        self.prev = array('i')
+        self.bucket = array('i') # bucket of each node, -1 when not queued
+        self.size = 0
+
+    def _link(self, node_id:int, bucket:int):
+        head = self.heads[bucket]
+        self.next[node_id] = head
+        self.prev[node_id] = -1
+        if head >= 0:
+            self.prev[head] = node_id
+        self.heads[bucket] = node_id
+        self.bucket[node_id] = bucket
+
+    def _unlink(self, node_id:int):
+        next_id = self.next[node_id]
+        prev_id = self.prev[node_id]
+        if prev_id >= 0:
+            self.next[prev_id] = next_id
+        else:
+            self.heads[self.bucket[node_id]] = next_id
+        if next_id >= 0:
+            self.prev[next_id] = prev_id
+        self.bucket[node_id] = -1
+
+    def add(self, node_id:int, count:int):
+        if node_id >= len(self.bucket):
+            grow = array('i', [-1]) * max(node_id + 1 - len(self.bucket), len(self.bucket))
+            self.next.extend(grow)
+            self.prev.extend(grow)
+            self.bucket.extend(grow)
+        assert self.bucket[node_id] < 0
+        self._link(node_id, max(min(count, self.num_states), 0))
+        self.size += 1
+
+    def add_many(self, node_ids:np.ndarray, counts:np.ndarray):
+        # queue many new nodes with a few array operations, leaving the buckets as add() in this order would:
+        # every bucket chains its new nodes last to first in front of the ones it already held
+        if not len(node_ids):
+            return
+        end = int(node_ids.max()) + 1
+        if end > len(self.bucket):
+            grow = array('i', [-1]) * max(end - len(self.bucket), len(self.bucket))
+            self.next.extend(grow)
+            self.prev.extend(grow)
+            self.bucket.extend(grow)
+        buckets = np.clip(counts, 0, self.num_states)
+        order = np.lexsort((-np.arange(len(node_ids)), buckets))
+        ids, buckets = np.asarray(node_ids)[order], buckets[order]
+        first = np.flatnonzero(np.diff(buckets, prepend=-1))
+        last = np.append(first[1:], len(ids)) - 1
+        next_ids = np.frombuffer(self.next, dtype=np.intc)
+        prev_ids = np.frombuffer(self.prev, dtype=np.intc)
+        bucket_ids = np.frombuffer(self.bucket, dtype=np.intc)
+        heads = np.frombuffer(self.heads, dtype=np.intc)
+        assert (bucket_ids[ids] < 0).all()
+        old_heads = heads[buckets[first]]
+        next_ids[ids[:-1]] = ids[1:]
+        prev_ids[ids[1:]] = ids[:-1]
+        next_ids[ids[last]] = old_heads
+        prev_ids[ids[first]] = -1
+        prev_ids[old_heads[old_heads >= 0]] = ids[last][old_heads >= 0]
+        bucket_ids[ids] = buckets
+        heads[buckets[first]] = ids[first]
+        del next_ids, prev_ids, bucket_ids, heads # release the buffers so the arrays can grow again
+        self.size += len(ids)
+
+    def trim(self, size:int):
+        # drop the spare capacity past the first size ids
+        del self.next[size:], self.prev[size:], self.bucket[size:]
+
+    def remove(self, node_id:int):
+        if node_id < len(self.bucket) and self.bucket[node_id] >= 0:
+            self._unlink(node_id)
+            self.size -= 1
+
+    def update(self, node_id:int, count:int):
+        new_bucket = max(min(count, self.num_states), 0)
+        if new_bucket != self.bucket[node_id]:
+            self._unlink(node_id)
+            self._link(node_id, new_bucket)
+
+    def pop(self) -> int:
+        for head in self.heads:
+            if head >= 0:
+                self._unlink(head)
+                self.size -= 1
+                return head
+
+    def empty(self):
+        return self.size == 0
+
+    def snapshot(self) -> tuple:
+        return self.heads[:], self.next[:], self.prev[:], self.bucket[:], self.size
+
+    def restore(self, snapshot:tuple):
+        heads, next_ids, prev_ids, bucket, self.size = snapshot
+        self.heads = heads[:]
+        self.next = next_ids[:]
+        self.prev = prev_ids[:]
+        self.bucket = bucket[:]
+
+
+class EntropyHeap:
+    # min-entropy queue with the IndexSort interface, keyed by float entropies instead of integer counts.
+    # a lazy deletion heap of (key, noise, node id): changing a key pushes a fresh entry and entries whose key no
+    # longer matches the node's current key are skipped when they surface, so decrease-key is one heappush
+    def __init__(self, seed:float):
+        self.tiebreak = random.Random(seed) # random noise breaks ties between equal keys
+        self.heap:list[tuple[float,float,int]] = []
+        self.key = array('d') # current key of each node, NaN when not queued
+        self.size = 0
+
+    def _grow(self, end:int):
+        if end > len(self.key):
+            self.key.extend(array('d', [np.nan]) * max(end - len(self.key), len(self.key)))
+
+    def _push(self, node_id:int, key:float):
+        self.key[node_id] = key
+        heappush(self.heap, (key, self.tiebreak.random(), node_id))
+        if len(self.heap) > 2 * self.size + 64:
+            # drop the stale entries once they outnumber the live ones
+            self.heap = [entry for entry in self.heap if self.key[entry[2]] == entry[0]]
+            heapify(self.heap)
+
+    def add(self, node_id:int, key:float):
+        self._grow(node_id + 1)
+        assert self.key[node_id] != self.key[node_id] # NaN, not queued yet
+        self.size += 1
+        self._push(node_id, key)
+
+    def add_many(self, node_ids:'Iterable[int]', keys:'Iterable[float]'):
+        # queue many new nodes with one heapify
+        entries = [(key, self.tiebreak.random(), node_id) for node_id, key in zip(node_ids, keys)]
+        if entries:
+            self._grow(max(entry[2] for entry in entries) + 1)
+        for key, _, node_id in entries:
+            self.key[node_id] = key
+        self.heap.extend(entries)
+        heapify(self.heap)
+        self.size += len(entries)
+
+    def trim(self, size:int):
+        del self.key[size:]
+
+    def remove(self, node_id:int):
+        if node_id < len(self.key) and self.key[node_id] == self.key[node_id]:
+            self.key[node_id] = np.nan
+            self.size -= 1
+
+    def update(self, node_id:int, key:float):
+        if key != self.key[node_id]:
+            self._push(node_id, key)
+
+    def pop(self) -> int:
+        while self.heap:
+            key, _, node_id = heappop(self.heap)
+            if self.key[node_id] == key:
+                self.key[node_id] = np.nan
+                self.size -= 1
+                return node_id
+
+    def empty(self):
+        return self.size == 0
+
+    def snapshot(self) -> tuple:
+        return self.heap.copy(), self.key[:], self.size
+
+    def restore(self, snapshot:tuple):
+        heap, key, self.size = snapshot
+        self.heap = heap.copy()
+        self.key = key[:]
+
+
+class BitsetNode:
+    # read-only view of a node stored in a bitset mode WaveFunctionCollapse, mirrors the Node attributes
+    __slots__ = ('wfc', 'index')
+
+    def __init__(self, wfc:'WaveFunctionCollapse', index:int):
+        self.wfc = wfc
+        self.index = index
+
+    @property
+    def name(self) -> str:
+        return self.wfc.node_names[self.index]
+
+    @property
+    def collapsed(self) -> 'str|None':
+        state = int(self.wfc.collapsed_state[self.index])
+        return None if state < 0 else self.wfc.states[state]
+
+    @property
+    def priority_modifier(self) -> int:
+        return int(self.wfc.priority[self.index])
+
+    @property
+    def state_count(self) -> int:
+        if self.wfc.collapsed_state[self.index] >= 0:
+            return len(self.wfc.states)
+        return int(popcount(self.wfc.domains[self.index]))
+
+    @property
+    def possible_states(self) -> 'dict[str,bool]':
+        possible = dict.fromkeys(self.wfc.states, False)
+        if self.wfc.collapsed_state[self.index] < 0:
+            for i in mask_indices(self.wfc.domains[self.index]):
+                possible[self.wfc.states[i]] = True
+        return possible
+
+    def num_states(self) -> int:
+        return self.state_count + self.priority_modifier + (0 if self.collapsed is None else len(self.wfc.states))
+
+    def __str__(self):
+        return "{%s | %s | %d}" % (self.name, self.collapsed, self.num_states())
+
+
+class NodeTable(Mapping):
+    # name -> BitsetNode mapping so bitset mode keeps the wfc.nodes[name] API
+    def __init__(self, wfc:'WaveFunctionCollapse'):
+        self.wfc = wfc
+
+    def __getitem__(self, name:str) -> BitsetNode:
+        return BitsetNode(self.wfc, self.wfc.node_index[name])
+
+    def __contains__(self, name) -> bool:
+        return name in self.wfc.node_index
+
+    def __iter__(self):
+        return iter(self.wfc.node_names)
+
+    def __len__(self) -> int:
+        return len(self.wfc.node_names)
 
-        
 
 class WaveFunctionCollapse:
-    def __init__(self, states:'list[str]', adjacencyAllow:'dict[str,list[str]]'):
+    def __init__(self, states:'list[str]', adjacencyAllow:'dict[str,list[str]]', mode:str='classic', propagation:str='neighbor',
+                 backtrack_budget:int=0, labelAllow:'dict[str,dict[str,list[str]]]|None'=None, seed:'int|None'=None,
+                 weights:'dict[str,float]|None'=None, heuristic:str='count', stats:bool=False, kernel:str='auto',
+                 prune:bool=True):
+        # mode 'classic' keeps a Node object per node, mode 'bitset' stores every domain as a row of uint64 words
+        # propagation 'neighbor' only prunes the neighbors of a collapsed node, 'ac3' propagates until arc consistent
+        # backtrack_budget is how many contradictions an attempt may undo from its trail before restarting from scratch
+        # labelAllow holds one directed rule table per edge label: addEdge(a, b, label) lets b be in the states
+        # labelAllow[label][state of a], and a in the states that allow the state of b
+        # seed gives the bitset solver its own random.Random, without one it draws from the global random module
+        # weights sets how often each state is picked when a node collapses, states left out weigh 1; a state of
+        # weight 0 is only picked when no state of positive weight is left
+        # heuristic 'count' collapses the node with the fewest states left first, 'entropy' the one with the lowest
+        # Shannon entropy of its state weights (bitset mode), priority modifiers are added to either
+        # stats makes every solve() count collapses, removed states, contradictions, restarts, backtracks and queue
+        # moves and time its phases into self.stats, observe() adds callbacks; without either nothing is counted
+        # kernel 'numba' runs bitset mode solves through the compiled loop of wfc_kernel, 'python' through the methods
+        # below, 'auto' picks numba when it is installed. Both give the same result for the same seed; solves the
+        # kernel does not cover (ac3, backtracking, the entropy heuristic, weights, groups, stats) use the methods
+        # prune makes save_initial() of the bitset mode remove every state without support in some neighbor until
+        # the initial domains are arc consistent, whatever the propagation, before the first collapse
+        if mode not in ('classic', 'bitset'):
+            raise ValueError("unknown mode %r" % (mode,))
+        if propagation not in ('neighbor', 'ac3'):
+            raise ValueError("unknown propagation %r" % (propagation,))
+        if propagation == 'ac3' and mode != 'bitset':
+            raise ValueError("ac3 propagation requires mode='bitset'")
+        if backtrack_budget > 0 and mode != 'bitset':
+            raise ValueError("backtracking requires mode='bitset'")
+        if labelAllow and mode != 'bitset':
+            raise ValueError("edge labels require mode='bitset'")
+        if heuristic not in ('count', 'entropy'):
+            raise ValueError("unknown heuristic %r" % (heuristic,))
+        if heuristic == 'entropy' and mode != 'bitset':
+            raise ValueError("the entropy heuristic requires mode='bitset'")
+        if kernel not in ('auto', 'python', 'numba'):
+            raise ValueError("unknown kernel %r" % (kernel,))
+        if kernel == 'numba' and mode != 'bitset':
+            raise ValueError("the numba kernel requires mode='bitset'")
+        if kernel == 'numba' and wfc_kernel.numba is None:
+            raise ValueError("the numba kernel requires numba to be installed")
+        self.mode = mode
+        self.propagation = propagation
+        self.backtrack_budget = backtrack_budget
+        self.heuristic = heuristic
+        self.prune = prune
+        self.kernel = 'numba' if mode == 'bitset' and kernel != 'python' and wfc_kernel.numba is not None else 'python'
+        self.restarts = 0 # restarts taken by the last solve()
+        self.backtracks = 0 # contradictions undone by the last solve()
+        self.stats:'dict[str,int|float|bool]|None' = dict.fromkeys(STAT_COUNTERS, 0) if stats else None
+        self.observers:dict[str,list[Callable]] = dict()
+        self.rng = random if seed is None else random.Random(seed)
         self.states = states.copy()
-        self.nodes:dict[str,Node] = dict()
-        self.uncertain_nodes = NodeSort(states)
-        self.adjacencyList:dict[str,set[str]] = dict()
         self.adjacencyAllow = adjacencyAllow.copy()
+        self.labelAllow = dict(labelAllow or {})
+        self.weights:'dict[str,float]|None' = None
+        if weights:
+            self.weights = {state: float(weights.get(state, 1)) for state in self.states}
+            if not all(weight >= 0 for weight in self.weights.values()):
+                raise ValueError("weights can not be negative")
         self.adjacencyBan:dict[str,list[str]] = dict() # what states are not allowed to be adjacent to each other, the inverse of adj
-        
-        self.nodes_initial:dict[str,Node] = None
-        self.uncertain_nodes_initial:NodeSort = None
 
         for state, adj_states in self.adjacencyAllow.items():
             # compile the list of banned states not allowed to be adjacent to each other
-            adj_ban_states = self.states.copy()
-            for adj_state in adj_states:
-                adj_ban_states.remove(adj_state)
-            self.adjacencyBan[state] = adj_ban_states
-    
+            allowed = set(adj_states)
+            self.adjacencyBan[state] = [s for s in self.states if s not in allowed]
+
+        if mode == 'bitset':
+            self._init_bitset()
+            return
+
+        self.state_bits = {state: 1 << i for i, state in enumerate(self.states)} # shared by every Node
+        self.nodes:dict[str,Node] = dict()
+        self.uncertain_nodes = NodeSort(states)
+        self.adjacencyList:dict[str,set[str]] = dict()
+        self.snapshots:dict[str,tuple] = dict()
+
+    def _init_bitset(self):
+        self.state_index:dict[str,int] = {state: i for i, state in enumerate(self.states)}
+        self.num_words = max(1, -(-len(self.states) // WORD_BITS))
+        self.full_mask = state_mask(range(len(self.states)), self.num_words)
+        self.state_masks = np.stack([state_mask([i], self.num_words) for i in range(len(self.states))])
+        self.labels:list[str] = list(self.labelAllow)
+        self.label_index:dict[str,int] = {label: i for i, label in enumerate(self.labels)}
+        # rule tables and state analysis, shared with every solver over the same rules (see compile_rules)
+        self.rules = compile_rules(self.states, self.adjacencyAllow, self.labelAllow)
+        self.compatible = self.rules['compatible']
+        self.allow_masks = self.rules['allow_masks']
+        # allow_ints[s][k]: allow_masks[k, s] as a python int, for the scalar path of single word domains
+        self.allow_ints = self.allow_masks[:, :, 0].T.tolist() if self.num_words == 1 else None
+        self.support_bytes, self.support_table = self.rules['support_bytes'], self.rules['support_table']
+        self.support_chunks = np.arange(len(self.support_bytes))
+        self.state_weights = np.array([1.0 if self.weights is None else self.weights[state] for state in self.states])
+        if self.weights is not None:
+            self.weight_totals, self.weight_tables = weight_tables(self.state_weights.tolist(), self.num_words, self.support_bytes)
+            self.weight_positions = list(enumerate(self.support_bytes.tolist()))
+
+        self.node_names:list[str] = []
+        self.node_index:dict[str,int] = dict()
+        # edges are collected as id pairs and turned into a CSR adjacency (offsets + indices) by compile()
+        self.edge_src = array('q')
+        self.edge_dst = array('q')
+        self.edge_label = array('q')
+        self.offsets:'np.ndarray|None' = None
+        self.indices:'np.ndarray|None' = None
+        self.arc_kinds:'np.ndarray|None' = None # kind of every CSR entry, None when no edge is labelled
+        self.parallel_arcs = False # some pair of nodes is joined by arcs of different kinds
+        # all-different groups are collected as id arrays and compiled into two CSR tables: group g holds
+        # group_members[group_offsets[g]:group_offsets[g + 1]], node v is in member_groups[member_offsets[v]:...]
+        self.group_lists:list[np.ndarray] = []
+        self.group_offsets:'np.ndarray|None' = None
+        self.group_members:'np.ndarray|None' = None
+        self.member_offsets:'np.ndarray|None' = None
+        self.member_groups:'np.ndarray|None' = None
+        self.domains = np.zeros((0, self.num_words), dtype=np.uint64)
+        self.collapsed_state = np.zeros(0, dtype=np.int32) # state index, -1 while uncertain
+        self.priority = np.zeros(0, dtype=np.int32)
+        # first id of every addNode()/add_nodes() call that left nodes uncertain, compile() queues them all at once
+        self.queue_batches = array('q')
+
+        self.nodes = NodeTable(self)
+        if self.heuristic == 'entropy':
+            # w log w, 0 for a weight of 0
+            self.weight_log_weights = self.state_weights * np.log(np.where(self.state_weights > 0, self.state_weights, 1))
+            self.uncertain_nodes = EntropyHeap(self.rng.random())
+        else:
+            self.uncertain_nodes = IndexSort(len(self.states))
+        self.snapshots:dict[str,tuple] = dict()
+        self.restart_snapshot = 'initial' # what a contradiction restarts from, resolve() points it at its edit region
+        self.trail:'list[tuple]|None' = None # undo log of the current attempt, only kept while backtracking
+        # domains as added, before the initial propagation, so resolve() can reopen nodes
+        self.base_domains:'np.ndarray|None' = None
+        self.base_collapsed:'np.ndarray|None' = None
+        self.pins:dict[int,int] = dict() # node id -> state index forced by pin()
+        self.released:set[int] = set() # node ids waiting for resolve()
+        self.problem_path:'str|None' = None # problem file this solver was mapped from
+        self.infeasible = False # save_initial() found the givens contradict each other, no solve can succeed
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_names)
+
+    def _grow_bitset(self, minimum:int=0):
+        capacity = max(16, 2 * len(self.collapsed_state), minimum)
+        domains = np.zeros((capacity, self.num_words), dtype=np.uint64)
+        domains[:len(self.domains)] = self.domains
+        collapsed_state = np.full(capacity, -1, dtype=np.int32)
+        collapsed_state[:len(self.collapsed_state)] = self.collapsed_state
+        priority = np.zeros(capacity, dtype=np.int32)
+        priority[:len(self.priority)] = self.priority
+        self.domains, self.collapsed_state, self.priority = domains, collapsed_state, priority
+
     def addNode(self, name:str, assign:'str|tuple[str]|None'=None, priority_modifier:int=0):
         # positive priority modifier means lower priority
-        node = Node(name, self.states, assign, priority_modifier)
+        if self.mode == 'bitset':
+            self._add_bitset_node(name, assign, priority_modifier)
+            return
+
+        node = Node(name, self.state_bits, assign, priority_modifier, self.weights)
         self.nodes[name] = node
         self.adjacencyList[name] = set()
         if type(assign) != str:
             self.uncertain_nodes.add(node)
 
-    def addEdge(self, node1_name:str, node2_name:str):
+    def _add_bitset_node(self, name:str, assign:'str|tuple[str]|None', priority_modifier:int):
+        if self.offsets is not None:
+            raise RuntimeError("cannot add nodes after compile()")
+        assert name not in self.node_index
+        node_id = len(self.node_names)
+        if node_id == len(self.collapsed_state):
+            self._grow_bitset()
+        self.node_names.append(name)
+        self.node_index[name] = node_id
+
+        if type(assign) == str:
+            self.domains[node_id] = self.state_masks[self.state_index[assign]]
+            self.collapsed_state[node_id] = self.state_index[assign]
+        elif type(assign) == tuple:
+            self.domains[node_id] = state_mask([self.state_index[s] for s in assign], self.num_words)
+            self.collapsed_state[node_id] = -1
+        else:
+            self.domains[node_id] = self.full_mask
+            self.collapsed_state[node_id] = -1
+        self.priority[node_id] = priority_modifier
+
+        if type(assign) != str:
+            self.queue_batches.append(node_id)
+
+    def add_nodes(self, names_or_count:'int|Iterable[str]', assign:'str|tuple[str]|None'=None, priority_modifier:int=0) -> np.ndarray:
+        # bulk addNode with the same assign and priority for every node, returns the new node ids;
+        # a count instead of names names the nodes after their ids
+        if type(names_or_count) == int:
+            start = self.num_nodes if self.mode == 'bitset' else len(self.nodes)
+            names = [str(i) for i in range(start, start + names_or_count)]
+        else:
+            names = list(names_or_count)
+        if self.mode != 'bitset':
+            start = len(self.nodes)
+            for name in names:
+                self.addNode(name, assign, priority_modifier)
+            return np.arange(start, start + len(names))
+
+        if self.offsets is not None:
+            raise RuntimeError("cannot add nodes after compile()")
+        start = self.num_nodes
+        end = start + len(names)
+        # validated before anything changes, a rejected batch leaves the solver as it was
+        if len(set(names)) != len(names) or any(name in self.node_index for name in names):
+            raise ValueError("duplicate node names")
+        self.node_index.update(zip(names, range(start, end)))
+        self.node_names.extend(names)
+        if end > len(self.collapsed_state):
+            self._grow_bitset(end)
+
+        self.priority[start:end] = priority_modifier
+        if type(assign) == str:
+            self.domains[start:end] = self.state_masks[self.state_index[assign]]
+            self.collapsed_state[start:end] = self.state_index[assign]
+        else:
+            possible = self.states if assign is None else assign
+            self.domains[start:end] = state_mask([self.state_index[s] for s in possible], self.num_words)
+            self.collapsed_state[start:end] = -1
+            self.queue_batches.append(start)
+        return np.arange(start, end)
+
+    def add_edges(self, src:'Iterable[int]|np.ndarray', dst:'Iterable[int]|np.ndarray', label:'str|None'=None):
+        # bulk addEdge between node ids (as returned by add_nodes), duplicates are dropped by compile()
+        src = np.asarray(src if isinstance(src, np.ndarray) else list(src), dtype=np.int64).ravel()
+        dst = np.asarray(dst if isinstance(dst, np.ndarray) else list(dst), dtype=np.int64).ravel()
+        assert src.shape == dst.shape
+        if self.mode != 'bitset':
+            names = list(self.nodes)
+            for node1, node2 in zip(src.tolist(), dst.tolist()):
+                self.addEdge(names[node1], names[node2], label)
+            return
+
+        if self.offsets is not None:
+            raise RuntimeError("cannot add edges after compile()")
+        if len(src) and (min(src.min(), dst.min()) < 0 or max(src.max(), dst.max()) >= self.num_nodes):
+            raise IndexError("edge endpoint is not a node id")
+        self.edge_src.frombytes(src.tobytes())
+        self.edge_dst.frombytes(dst.tobytes())
+        self.edge_label.frombytes(np.full(len(src), -1 if label is None else self.label_index[label], dtype=np.int64).tobytes())
+
+    def add_all_different(self, nodes:'Iterable[str]|Iterable[int]|np.ndarray'):
+        # the nodes (names or ids) must all end up in different states. The group is propagated as a whole: a
+        # state left as the only one of a node (naked single) is removed from the others and, when the group has as
+        # many nodes as there are states, a state only one node can still take (hidden single) is forced onto it
+        if self.mode != 'bitset':
+            raise ValueError("all-different groups require mode='bitset'")
+        if self.offsets is not None:
+            raise RuntimeError("cannot add groups after compile()")
+        nodes = nodes if type(nodes) == np.ndarray else list(nodes)
+        if len(nodes) and type(nodes[0]) == str:
+            ids = np.array([self.node_index[name] for name in nodes], dtype=np.int64)
+        else:
+            ids = np.asarray(nodes, dtype=np.int64).ravel()
+        if len(np.unique(ids)) != len(ids):
+            raise ValueError("a group can not hold a node twice")
+        if len(ids) > len(self.states):
+            raise ValueError("a group of %d nodes can not be all different with %d states" % (len(ids), len(self.states)))
+        self.group_lists.append(ids)
+
+    def addEdge(self, node1_name:str, node2_name:str, label:'str|None'=None):
+        if self.mode == 'bitset':
+            # duplicate edges are only dropped by compile(), so this never reports them
+            if self.offsets is not None:
+                raise RuntimeError("cannot add edges after compile()")
+            self.edge_src.append(self.node_index[node1_name])
+            self.edge_dst.append(self.node_index[node2_name])
+            self.edge_label.append(-1 if label is None else self.label_index[label])
+            return
+        if label is not None:
+            raise ValueError("edge labels require mode='bitset'")
+
         assert node1_name in self.nodes
         assert node2_name in self.nodes
         assert (node1_name in self.adjacencyList[node2_name]) == (node2_name in self.adjacencyList[node1_name])
@@ -134,52 +829,1176 @@ class WaveFunctionCollapse:
         self.adjacencyList[node1_name].add(node2_name)
         self.adjacencyList[node2_name].add(node1_name)
 
+    def compile(self):
+        # freeze the graph of a bitset mode solver into a CSR adjacency over dense node ids,
+        # solving only touches integers from here on and names are only looked up at the API boundary
+        if self.mode != 'bitset':
+            raise ValueError("compile() requires mode='bitset'")
+        if self.offsets is not None:
+            return
+        n = max(self.num_nodes, 1)
+        num_kinds = len(self.allow_masks)
+        src = np.frombuffer(self.edge_src, dtype=np.int64)
+        dst = np.frombuffer(self.edge_dst, dtype=np.int64)
+        label = np.frombuffer(self.edge_label, dtype=np.int64)
+        forward = np.where(label < 0, 0, 2 * label + 1)
+        reverse = np.where(label < 0, 0, 2 * label + 2)
+        keys = np.concatenate(((src * n + dst) * num_kinds + forward, (dst * n + src) * num_kinds + reverse))
+        keys = np.unique(keys[np.concatenate((src, dst)) != np.concatenate((dst, src))]) # sorted by source, no self loops
+        arcs = keys // num_kinds
+        self.offsets = np.zeros(self.num_nodes + 1, dtype=np.int32 if len(arcs) < 2 ** 31 else np.int64)
+        np.cumsum(np.bincount(arcs // n, minlength=self.num_nodes), out=self.offsets[1:])
+        self.indices = (arcs % n).astype(np.int32 if n < 2 ** 31 else np.int64)
+        if num_kinds > 1:
+            self.arc_kinds = (keys % num_kinds).astype(np.int16)
+        self.parallel_arcs = self._has_parallel_arcs()
+        self.edge_src = array('q')
+        self.edge_dst = array('q')
+        self.edge_label = array('q')
+        if self.group_lists:
+            sizes = [len(group) for group in self.group_lists]
+            self.group_offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+            np.cumsum(sizes, out=self.group_offsets[1:])
+            self.group_members = np.concatenate(self.group_lists).astype(np.int32)
+            order = np.argsort(self.group_members, kind='stable')
+            self.member_groups = np.repeat(np.arange(len(sizes), dtype=np.int32), sizes)[order]
+            self.member_offsets = np.zeros(self.num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.group_members, minlength=self.num_nodes), out=self.member_offsets[1:])
+            self.group_lists = []
+        # no node can be added from here on, so the arrays lose the capacity they grew for more
+        n = self.num_nodes
+        self.domains = self.domains[:n].copy()
+        self.collapsed_state = self.collapsed_state[:n].copy()
+        self.priority = self.priority[:n].copy()
+        self._queue_added()
+        self.uncertain_nodes.trim(n)
+
+    def _queue_added(self):
+        # queue every node left uncertain by addNode()/add_nodes() with one _queue_keys() call, in the order the
+        # calls would have queued them one by one, each call chaining its ids first to last in front of a bucket
+        ids = np.flatnonzero(self.collapsed_state < 0)
+        keys = self._queue_keys(self.domains[ids], ids)
+        if self.heuristic == 'entropy':
+            self.uncertain_nodes.add_many(ids.tolist(), keys)
+        else:
+            batches = np.searchsorted(np.frombuffer(self.queue_batches, dtype=np.int64), ids, side='right')
+            order = np.lexsort((-ids, batches))
+            self.uncertain_nodes.add_many(ids[order], np.asarray(keys, dtype=np.int64)[order])
+        self.queue_batches = array('q')
+
+    def _has_parallel_arcs(self) -> bool:
+        # rows of the CSR adjacency are sorted, so arcs of different kinds to the same neighbor sit side by side
+        same = self.indices[1:] == self.indices[:-1]
+        row_ends = self.offsets[1:-1] - 1
+        same[row_ends[(row_ends >= 0) & (row_ends < len(same))]] = False
+        return bool(same.any())
+
+    def neighbor_ids(self, node_id:int) -> np.ndarray:
+        self.compile()
+        return self.indices[self.offsets[node_id]:self.offsets[node_id + 1]]
+
+    def save_snapshot(self, name:str='initial'):
+        # snapshots are flat copies of the domains and the bucket queue, restoring one never rebuilds objects
+        if self.mode == 'bitset':
+            n = self.num_nodes
+            self.snapshots[name] = (self.domains[:n].copy(), self.collapsed_state[:n].copy(), self.uncertain_nodes.snapshot())
+            return
+
+        nodes = list(self.nodes.values())
+        node_states = [(node.mask, node.collapsed, node.state_count) for node in nodes]
+        self.snapshots[name] = (nodes, node_states, self.uncertain_nodes.snapshot())
+
+    def load_snapshot(self, name:str='initial'):
+        # only the nodes that existed when the snapshot was taken are restored
+        if self.mode == 'bitset':
+            domains, collapsed_state, uncertain_nodes = self.snapshots[name]
+            n = len(domains)
+            self.domains[:n] = domains
+            self.collapsed_state[:n] = collapsed_state
+            self.uncertain_nodes.restore(uncertain_nodes)
+            return
+
+        nodes, node_states, uncertain_nodes = self.snapshots[name]
+        for node, (mask, collapsed, state_count) in zip(nodes, node_states):
+            node.mask = mask
+            node.collapsed = collapsed
+            node.state_count = state_count
+        self.nodes = {node.name: node for node in nodes}
+        self.uncertain_nodes.restore(uncertain_nodes)
+
+    def drop_snapshot(self, name:str):
+        del self.snapshots[name]
+
     def save_initial(self):
-        self.nodes_initial = copy.deepcopy(self.nodes)
-        self.uncertain_nodes_initial = copy.deepcopy(self.uncertain_nodes)
+        if self.mode == 'bitset':
+            self.compile()
+            self.base_domains = self.domains[:self.num_nodes].copy()
+            self.base_collapsed = self.collapsed_state[:self.num_nodes].copy()
+            # nodes assigned or narrowed up front constrain their neighbors before the first collapse
+            restricted = (self.domains[:self.num_nodes] != self.full_mask).any(axis=1)
+            if self.prune:
+                # rules that leave a state without any partner across some arc kind prune full domains too
+                full_support = self.support_mask(self.full_mask, self.rules['prune_table'])
+                restricted[:] |= (full_support != self.full_mask).any()
+                consistent = self._prune(np.flatnonzero(restricted))
+                restricted[:] = False
+            else:
+                consistent = True
+            for node_id in np.flatnonzero(restricted).tolist():
+                if self.propagation == 'ac3':
+                    consistent &= self._ac3_bitset(node_id)
+                else:
+                    consistent &= self._restrict_neighbors(node_id, self.support_mask(self.domains[node_id])) is not None
+            if self.group_offsets is not None and consistent:
+                # a contradiction among the givens of a group (two equal ones) can leave every domain non empty
+                changed = self._propagate_groups(range(len(self.group_offsets) - 1))
+                consistent = changed is not None
+                if self.propagation == 'ac3':
+                    for node_id in changed or []:
+                        consistent &= self._ac3_bitset(node_id)
+            # two adjacent givens that break a rule leave every domain non empty as well
+            consistent = consistent and self._collapsed_consistent(np.arange(self.num_nodes))
+            self.infeasible = not consistent or not self.domains[:self.num_nodes].any(axis=1).all()
+        self.save_snapshot('initial')
+
+    def _prune(self, node_ids:np.ndarray) -> bool:
+        # arc consistency of the whole graph by frontiers: the neighbors of the frontier nodes lose every state the
+        # frontier does not support, then the nodes that lost one are the next frontier; False when a domain runs empty
+        frontier = node_ids
+        while len(frontier):
+            arcs = self._arcs(frontier)
+            sources = np.repeat(np.arange(len(frontier)), np.diff(self.offsets)[frontier])
+            nb = self.indices[arcs]
+            uncertain = self.collapsed_state[nb] < 0
+            arcs, sources, nb = arcs[uncertain], sources[uncertain], nb[uncertain]
+            support = self.support_mask(self.domains[frontier], self.rules['prune_table'])
+            kinds = 0 if self.arc_kinds is None else self.arc_kinds[arcs]
+            targets = np.unique(nb)
+            old = self.domains[targets]
+            np.bitwise_and.at(self.domains, nb, support[sources, kinds])
+            new = self.domains[targets]
+            changed = (new != old).any(axis=1)
+            frontier, new = targets[changed], new[changed]
+            counts = popcount(new)
+            if not counts.all():
+                return False
+            for node_id, key in zip(frontier.tolist(), self._queue_keys(new, frontier, counts)):
+                self.uncertain_nodes.update(node_id, key)
+        return True
 
     def load_initial(self):
-        self.nodes = copy.deepcopy(self.nodes_initial)
-        self.uncertain_nodes = copy.deepcopy(self.uncertain_nodes_initial)
+        self.load_snapshot('initial')
+
+    def _restart(self):
+        if self.stats is not None:
+            start = perf_counter()
+        if self.mode == 'bitset':
+            self.load_snapshot(self.restart_snapshot)
+        else:
+            self.load_initial()
+        if self.stats is not None:
+            self.stats['restarts'] += 1
+            self.stats['restart_s'] += perf_counter() - start
+            self._notify('restart', self.restarts)
+
+    def observe(self, event:str, callback:Callable):
+        # call callback on every event of a kind from now on, turning statistics on:
+        # 'collapse' (name, state), 'contradiction' (name of the node whose collapse failed), 'backtrack' (name,
+        # refuted state), 'restart' (restarts so far) and 'solve' (the stats of the finished solve)
+        if event not in EVENTS:
+            raise ValueError("unknown event %r" % (event,))
+        self.observers.setdefault(event, []).append(callback)
+        if self.stats is None:
+            self.stats = dict.fromkeys(STAT_COUNTERS, 0)
+
+    def _notify(self, event:str, *args):
+        for callback in self.observers.get(event, ()):
+            callback(*args)
+
+    def _record_collapse(self, node:'int|str', state:'int|str', start:float) -> float:
+        now = perf_counter()
+        self.stats['collapses'] += 1
+        self.stats['collapse_s'] += now - start
+        if 'collapse' in self.observers:
+            if self.mode == 'bitset':
+                node, state = self.node_names[node], self.states[state]
+            self._notify('collapse', node, state)
+        return now
+
+    def _record_propagate(self, node:'int|str', success:bool, start:float):
+        self.stats['propagate_s'] += perf_counter() - start
+        if not success:
+            self.stats['contradictions'] += 1
+            if 'contradiction' in self.observers:
+                self._notify('contradiction', self.node_names[node] if self.mode == 'bitset' else node)
 
     # @profile
     def assert_adjacency_rule(self, name:str, state:str):
         assert state in self.states
+        if self.mode == 'bitset':
+            self.compile()
+            assert self._assert_bitset(self.node_index[name], self.state_index[state])
+            return
+
         neighbors = self.adjacencyList[name]
         ban_states = self.adjacencyBan[state]
 
         for nb in neighbors:
-            for s in ban_states:
-                nb_node = self.nodes[nb]
-                if nb_node.collapsed is None:
+            nb_node = self.nodes[nb]
+            if nb_node.collapsed is None:
+                count = nb_node.state_count
+                for s in ban_states:
                     nb_node.update_possible_states(s)
-                    self.uncertain_nodes.update(nb_node)
+                self.uncertain_nodes.update(nb_node)
+                if self.stats is not None:
+                    self.stats['removals'] += count - nb_node.state_count
+                    self.stats['queue_moves'] += 1
+
+    def _restrict_neighbors(self, node_id:int, support:np.ndarray) -> 'list[int]|None':
+        # one AND with the (kinds, num_words) support masks bans every unsupported state of every uncertain neighbor,
+        # returns the neighbors whose domain shrank, or None when one is left without any possible state
+        start, end = self.offsets[node_id], self.offsets[node_id + 1]
+        nb = self.indices[start:end]
+        uncertain = self.collapsed_state[nb] < 0
+        nb = nb[uncertain]
+        old = self.domains[nb]
+        if self.arc_kinds is None:
+            new = old & support[0]
+        else:
+            new = old & support[self.arc_kinds[start:end][uncertain]]
+        if self.parallel_arcs:
+            # a neighbor reached over arcs of several kinds keeps what all of them allow, not what the last one does
+            first = np.flatnonzero(np.diff(nb, prepend=-1))
+            nb, old, new = nb[first], old[first], np.bitwise_and.reduceat(new, first, axis=0)
+        changed = (new != old).any(axis=1)
+        if not changed.any():
+            return []
+        nb = nb[changed]
+        new = new[changed]
+        if self.trail is not None:
+            self.trail.append(('domains', nb, old[changed]))
+        self.domains[nb] = new
+        counts = popcount(new)
+        if self.stats is not None:
+            self.stats['removals'] += int(popcount(old[changed]).sum() - counts.sum())
+            self.stats['queue_moves'] += len(nb)
+        if not counts.all():
+            return None
+        nb_ids = nb.tolist()
+        for nb_id, key in zip(nb_ids, self._queue_keys(new, nb, counts)):
+            self.uncertain_nodes.update(nb_id, key)
+        return nb_ids
+
+    def _queue_keys(self, rows:np.ndarray, node_ids:'np.ndarray|list[int]', counts:'np.ndarray|None'=None) -> list:
+        # selection queue keys of nodes with the given domain rows, the number of states left (or the
+        # Shannon entropy of their weights) plus the priority modifier
+        if self.heuristic == 'entropy':
+            bits = unpack_masks(rows, len(self.states)).astype(np.float64)
+            total = bits @ self.state_weights
+            total = np.where(total > 0, total, 1) # nothing but states of weight 0 left, entropy 0
+            keys = np.log(total) - (bits @ self.weight_log_weights) / total
+        else:
+            keys = popcount(rows) if counts is None else counts
+        return (keys + self.priority[node_ids]).tolist()
+
+    def support_mask(self, domains:np.ndarray, table:'np.ndarray|None'=None) -> np.ndarray:
+        # union of the allowed masks of every state left in a (..., num_words) domain row, per arc kind,
+        # as a (..., kinds, num_words) array, from support_table or another table of the same layout
+        chunks = domains.view(np.uint8)[..., self.support_bytes]
+        return np.bitwise_or.reduce((self.support_table if table is None else table)[self.support_chunks, chunks], axis=-3)
+
+    def _assert_bitset(self, node_id:int, state:int) -> bool:
+        if self.num_words == 1:
+            return self._restrict_neighbors_int(node_id, self.allow_ints[state]) is not None
+        return self._restrict_neighbors(node_id, self.allow_masks[:, state]) is not None
+
+    def _restrict_neighbors_int(self, node_id:int, support:'list[int]') -> 'list[int]|None':
+        # _restrict_neighbors() for single word domains, on python ints one arc at a time: a collapse only touches a
+        # handful of neighbors, too few for array operations to pay for their overhead
+        start, end = int(self.offsets[node_id]), int(self.offsets[node_id + 1])
+        kinds = repeat(0) if self.arc_kinds is None else self.arc_kinds[start:end].tolist()
+        domains = self.domains[:, 0]
+        collapsed_state = self.collapsed_state
+        old_words:dict[int,int] = dict() # neighbor -> word before this call, in arc order
+        for nb_id, kind in zip(self.indices[start:end].tolist(), kinds):
+            if collapsed_state[nb_id] >= 0:
+                continue
+            old = int(domains[nb_id])
+            new = old & support[kind] # parallel arcs of different kinds AND into the same word
+            if new != old:
+                domains[nb_id] = new
+                old_words.setdefault(nb_id, old)
+        if not old_words:
+            return []
+        nb_ids = list(old_words)
+        if self.trail is not None:
+            self.trail.append(('domains', np.array(nb_ids), np.array(list(old_words.values()), dtype=np.uint64)[:, None]))
+        counts = [bin(int(domains[nb_id])).count('1') for nb_id in nb_ids]
+        if self.stats is not None:
+            self.stats['removals'] += sum(bin(old).count('1') for old in old_words.values()) - sum(counts)
+            self.stats['queue_moves'] += len(nb_ids)
+        if not all(counts):
+            return None
+        if self.heuristic == 'entropy':
+            keys = self._queue_keys(self.domains[nb_ids], nb_ids)
+        else:
+            keys = [count + int(self.priority[nb_id]) for nb_id, count in zip(nb_ids, counts)]
+        for nb_id, key in zip(nb_ids, keys):
+            self.uncertain_nodes.update(nb_id, key)
+        return nb_ids
+
+    def _ac3_bitset(self, node_id:int) -> bool:
+        # worklist arc consistency: whenever a domain shrinks, its neighbors are revised against the union of
+        # the allowed masks of its remaining states, until nothing changes or a domain runs empty
+        worklist = deque([node_id])
+        queued = {node_id}
+        while worklist:
+            node_id = worklist.popleft()
+            queued.discard(node_id)
+            changed = self._restrict_neighbors(node_id, self.support_mask(self.domains[node_id]))
+            if changed is None:
+                return False
+            if self.group_offsets is not None:
+                group_changed = self._propagate_groups(self._groups_of([node_id]))
+                if group_changed is None:
+                    return False
+                changed = changed + group_changed
+            for nb_id in changed:
+                if nb_id not in queued:
+                    queued.add(nb_id)
+                    worklist.append(nb_id)
+        return True
+
+    def _propagate_bitset(self, node_id:int, state:int) -> bool:
+        if self.propagation == 'ac3':
+            return self._ac3_bitset(node_id)
+        if not self._assert_bitset(node_id, state):
+            return False
+        return self.group_offsets is None or self._propagate_groups(self._groups_of([node_id])) is not None
+
+    def _groups_of(self, node_ids:'Iterable[int]') -> 'list[int]':
+        groups = []
+        for node_id in node_ids:
+            groups.extend(self.member_groups[self.member_offsets[node_id]:self.member_offsets[node_id + 1]].tolist())
+        return groups
+
+    def _propagate_groups(self, groups:'Iterable[int]') -> 'list[int]|None':
+        # revise all-different groups until none of them changes, returns the nodes whose domain shrank
+        # or None on a contradiction
+        worklist = deque(dict.fromkeys(groups))
+        queued = set(worklist)
+        changed_ids = []
+        while worklist:
+            group = worklist.popleft()
+            queued.discard(group)
+            changed = self._revise_group(group)
+            if changed is None:
+                return None
+            changed_ids.extend(changed)
+            for other in self._groups_of(changed):
+                if other not in queued:
+                    queued.add(other)
+                    worklist.append(other)
+        return changed_ids
+
+    def _revise_group(self, group:int) -> 'list[int]|None':
+        # naked and hidden singles of one group, on its domains as python ints (state i is bit i)
+        members = self.group_members[self.group_offsets[group]:self.group_offsets[group + 1]]
+        old = self.domains[members]
+        rows = [sum(word << (WORD_BITS * w) for w, word in enumerate(words)) for words in old.tolist()]
+        taken = 0
+        for row in rows:
+            if row & (row - 1) == 0:
+                if row == 0 or taken & row:
+                    return None
+                taken |= row
+        new_rows = [row if row & (row - 1) == 0 else row & ~taken for row in rows]
+        if 0 in new_rows:
+            return None
+        if len(members) == len(self.states):
+            once = twice = 0
+            for row in new_rows:
+                twice |= once & row
+                once |= row
+            if once != (1 << len(self.states)) - 1:
+                return None
+            hidden = once & ~twice & ~taken
+            while hidden:
+                bit = hidden & -hidden
+                hidden ^= bit
+                for i, row in enumerate(new_rows):
+                    if row & bit:
+                        new_rows[i] = bit
+                        break
+                else:
+                    return None # its only holder was already forced to another hidden state
+        changed = [i for i, (row, new_row) in enumerate(zip(rows, new_rows)) if row != new_row]
+        if not changed:
+            return []
+        nb = members[changed]
+        new = np.array([[(new_rows[i] >> (WORD_BITS * w)) & WORD_MASK for w in range(self.num_words)] for i in changed],
+                       dtype=np.uint64)
+        if self.trail is not None:
+            self.trail.append(('domains', nb, old[changed]))
+        self.domains[nb] = new
+        counts = popcount(new)
+        if self.stats is not None:
+            self.stats['removals'] += int(popcount(old[changed]).sum() - counts.sum())
+            self.stats['queue_moves'] += len(nb)
+        nb_ids = nb.tolist()
+        for nb_id, key in zip(nb_ids, self._queue_keys(new, nb, counts)):
+            self.uncertain_nodes.update(nb_id, key)
+        return nb_ids
+
+    def _collapse_bitset(self, node_id:int) -> int:
+        # pick among the remaining states of the node, uniformly or by weight
+        if self.weights is None:
+            possible_states = mask_indices(self.domains[node_id])
+            assert len(possible_states) > 0
+            state = possible_states[self.rng.randrange(len(possible_states))]
+        else:
+            state = self._draw_weighted(node_id)
+        if self.num_words == 1:
+            self.domains[node_id, 0] = 1 << state # a scalar store skips broadcasting a mask row
+        else:
+            self.domains[node_id] = self.state_masks[state]
+        self.collapsed_state[node_id] = state
+        return state
+
+    def _draw_weighted(self, node_id:int) -> int:
+        # weighted draw through the per-byte tables: sum the byte totals, walk to the byte the point falls in
+        # and bisect its cumulative weights
+        data = self.domains[node_id].tobytes()
+        totals = self.weight_totals
+        total = sum(totals[chunk][data[position]] for chunk, position in self.weight_positions)
+        if total == 0:
+            # only states of weight 0 left, the weights do not tell them apart
+            possible_states = mask_indices(self.domains[node_id])
+            return possible_states[self.rng.randrange(len(possible_states))]
+        pick = self.rng.random() * total
+        for chunk, position in self.weight_positions:
+            total = totals[chunk][data[position]]
+            if pick < total:
+                break
+            pick -= total
+        cumulative, states = self.weight_tables[chunk][data[position]]
+        return states[min(bisect_right(cumulative, pick), len(states) - 1)]
+
+    def _undo(self, position:int):
+        # roll the trail back to position, restoring domains and bucket positions
+        while len(self.trail) > position:
+            kind, nb, rows = self.trail.pop()
+            if kind == 'collapse':
+                self.domains[nb] = rows
+                self.collapsed_state[nb] = -1
+                self.uncertain_nodes.add(nb, self._queue_keys(rows[None], [nb])[0])
+            else:
+                self.domains[nb] = rows
+                for nb_id, key in zip(nb.tolist(), self._queue_keys(rows, nb)):
+                    self.uncertain_nodes.update(nb_id, key)
+
+    def _refute(self, node_id:int, state:int) -> bool:
+        # rule out a state that led to a contradiction and propagate the smaller domain
+        old = self.domains[node_id].copy()
+        new = old & ~self.state_masks[state]
+        count = int(popcount(new))
+        if count == 0:
+            return False
+        self.trail.append(('domains', np.array([node_id], dtype=np.intp), old[None]))
+        self.domains[node_id] = new
+        if self.stats is not None:
+            self.stats['removals'] += 1
+            self.stats['queue_moves'] += 1
+        self.uncertain_nodes.update(node_id, self._queue_keys(new[None], [node_id])[0])
+        if self.propagation == 'ac3':
+            return self._ac3_bitset(node_id)
+        return self.group_offsets is None or self._propagate_groups(self._groups_of([node_id])) is not None
+
+    def _solve_backtracking(self, max_restarts:'int|None'=None, chunk:int=0):
+        # depth first search over collapses; each decision remembers the trail position to undo back to.
+        # A generator as _solve_steps()
+        decisions:list[tuple[int,int]] = []
+        attempt_backtracks = 0
+        collapses = 0
+        stats = self.stats
+        self.trail = []
+        try:
+            while not self.uncertain_nodes.empty():
+                if stats is not None:
+                    start = perf_counter()
+                node_id = self.uncertain_nodes.pop()
+                decisions.append((len(self.trail), node_id))
+                self.trail.append(('collapse', node_id, self.domains[node_id].copy()))
+                state = self._collapse_bitset(node_id)
+                if stats is not None:
+                    start = self._record_collapse(node_id, state, start)
+                success = self._propagate_bitset(node_id, state)
+                if stats is not None:
+                    self._record_propagate(node_id, success, start)
+                while not success and decisions and attempt_backtracks < self.backtrack_budget:
+                    attempt_backtracks += 1
+                    self.backtracks += 1
+                    position, node_id = decisions.pop()
+                    state = int(self.collapsed_state[node_id])
+                    if stats is not None:
+                        stats['backtracks'] += 1
+                        self._notify('backtrack', self.node_names[node_id], self.states[state])
+                    self._undo(position)
+                    success = self._refute(node_id, state)
+                    if stats is not None and not success:
+                        # the refuted state left the node or a neighbor without states, a contradiction as well
+                        stats['contradictions'] += 1
+                        self._notify('contradiction', self.node_names[node_id])
+                if not success:
+                    # budget exhausted or nothing left to undo, fall back to a full restart
+                    if max_restarts is not None and self.restarts >= max_restarts:
+                        return False
+                    self.restarts += 1
+                    self._restart()
+                    decisions.clear()
+                    self.trail.clear()
+                    attempt_backtracks = 0
+                collapses += 1
+                if collapses == chunk:
+                    collapses = 0
+                    yield
+            return True
+        finally:
+            # also when the generator is closed or cancelled mid solve, a stale trail would only hold memory
+            self.trail = None
+
+    def solve_many(self, n:int, seeds:'Iterable[int]|None'=None, batched:bool=False) -> np.ndarray:
+        # n independent solutions from one built graph, as an (n, num_nodes) array of state indices;
+        # the graph, rule tables and initial snapshot are only built once. seeds gives solution i its own
+        # random.Random(seeds[i]) when solving one after the other, or seeds the shared numpy generator when batched.
+        # batched runs all n waves as one (n, num_nodes, num_words) array for solvers with plain neighbor pruning
+        # without backtracking or groups on the count heuristic. Every step of it scans all nodes of every wave, so
+        # it only pays off for many solutions of a small graph with the python kernel
+        if self.mode != 'bitset':
+            raise ValueError("solve_many() requires mode='bitset'")
+        seeds = None if seeds is None else list(seeds)
+        assert seeds is None or len(seeds) == n
+        if 'initial' not in self.snapshots:
+            self.save_initial()
+        if batched and self.heuristic != 'count':
+            raise ValueError("batched solve_many() only supports the count heuristic")
+        if batched and self.group_offsets is not None:
+            raise ValueError("batched solve_many() does not propagate all-different groups")
+        if batched and self.propagation != 'neighbor':
+            raise ValueError("batched solve_many() only supports neighbor propagation")
+        if batched and self.backtrack_budget > 0:
+            raise ValueError("batched solve_many() does not backtrack")
+        if batched:
+            return self._solve_batched(n, seeds)
+
+        solutions = np.empty((n, self.num_nodes), dtype=np.int32)
+        rng = self.rng
+        restarts = 0
+        for i in range(n):
+            if seeds is not None:
+                self.rng = random.Random(seeds[i])
+            self.load_initial()
+            self.solve()
+            restarts += self.restarts
+            solutions[i] = self.collapsed_state[:self.num_nodes]
+        self.rng = rng
+        self.restarts = restarts
+        return solutions
+
+    def _padded_neighbors(self) -> 'tuple[np.ndarray,np.ndarray]':
+        # CSR adjacency as a (num_nodes, max degree) table padded with -1, plus the arc kinds
+        n = self.num_nodes
+        degree = np.diff(self.offsets)
+        rows = np.repeat(np.arange(n), degree)
+        cols = np.arange(len(self.indices)) - self.offsets[rows]
+        neighbors = np.full((n, max(int(degree.max(initial=0)), 1)), -1, dtype=np.int64)
+        kinds = np.zeros(neighbors.shape, dtype=np.int64)
+        neighbors[rows, cols] = self.indices
+        if self.arc_kinds is not None:
+            kinds[rows, cols] = self.arc_kinds
+        return neighbors, kinds
+
+    def _solve_batched(self, n:int, seeds:'list[int]|None') -> np.ndarray:
+        # every step collapses the lowest bucket node of each unfinished wave (random tie break) and prunes its
+        # neighbors, a wave that hits a contradiction is reset to the initial snapshot on its own
+        rng = np.random.default_rng(seeds)
+        initial_domains, initial_collapsed, _ = self.snapshots['initial']
+        num_nodes, num_states = self.num_nodes, len(self.states)
+        neighbors, kinds = self._padded_neighbors()
+        priority = self.priority[:num_nodes]
+        domains = np.repeat(initial_domains[None], n, axis=0)
+        collapsed = np.repeat(initial_collapsed[None], n, axis=0)
+        initial_counts = popcount(initial_domains)
+        counts = np.repeat(initial_counts[None], n, axis=0)
+        restarts = np.zeros(n, dtype=np.int64)
+        waves = np.flatnonzero((collapsed < 0).any(axis=1))
+        while len(waves):
+            # pick one node per active wave
+            buckets = np.clip(counts[waves] + priority, 0, num_states) + rng.random((len(waves), num_nodes))
+            buckets[collapsed[waves] >= 0] = np.inf
+            nodes = np.argmin(buckets, axis=1)
+            rows = domains[waves, nodes]
+            if self.weights is None:
+                states = _select_bits(rows, (rng.random(len(waves)) * counts[waves, nodes]).astype(np.int64), num_states)
+            else:
+                states = _select_weighted(rows, rng.random(len(waves)), self.state_weights)
+            domains[waves, nodes] = self.state_masks[states]
+            collapsed[waves, nodes] = states
+            counts[waves, nodes] = 1
+
+            # prune the uncertain neighbors of every collapsed node
+            nb = neighbors[nodes]
+            wave_ids = np.broadcast_to(waves[:, None], nb.shape)
+            open_arcs = nb >= 0
+            open_arcs[open_arcs] = collapsed[wave_ids[open_arcs], nb[open_arcs]] < 0
+            arc_waves, arc_nodes = wave_ids[open_arcs], nb[open_arcs]
+            support = self.allow_masks[kinds[nodes][open_arcs], np.broadcast_to(states[:, None], nb.shape)[open_arcs]]
+            # ANDed in place, so parallel arcs of different kinds all restrict their neighbor
+            np.bitwise_and.at(domains, (arc_waves, arc_nodes), support)
+            new_counts = popcount(domains[arc_waves, arc_nodes])
+            counts[arc_waves, arc_nodes] = new_counts
+
+            # restart the waves that ran into a contradiction
+            failed = np.unique(arc_waves[new_counts == 0])
+            if len(failed):
+                domains[failed] = initial_domains
+                collapsed[failed] = initial_collapsed
+                counts[failed] = initial_counts
+                restarts[failed] += 1
+            waves = waves[(collapsed[waves] < 0).any(axis=1)]
+        self.restarts = int(restarts.sum())
+        return collapsed
 
     def propagate(self):
+        stats = self.stats
+        if stats is not None:
+            start = perf_counter()
+        if self.mode == 'bitset':
+            self.compile()
+            node_id = self.uncertain_nodes.pop()
+            state = self._collapse_bitset(node_id)
+            if stats is not None:
+                start = self._record_collapse(node_id, state, start)
+            success = self._propagate_bitset(node_id, state)
+            if stats is not None:
+                self._record_propagate(node_id, success, start)
+            return success
+
         name = self.uncertain_nodes.pop()
         node:Node = self.nodes[name]
         try:
-            success = node.collapse()
-            if not success:
+            if not node.collapse():
                 print("Collapse of node %s Failed (Already collapsed)" % (name))
-            else:
-                self.assert_adjacency_rule(name, node.collapsed)
-            return True
-        except Exception as error:
-            # print(error, node)
+                return True
+            if stats is not None:
+                start = self._record_collapse(name, node.collapsed, start)
+            self.assert_adjacency_rule(name, node.collapsed)
+            success = True
+        except AssertionError:
+            # a neighbor was left without any possible state
+            success = False
+        if stats is not None:
+            self._record_propagate(name, success, start)
+        return success
+
+    def solve(self, max_restarts:'int|None'=None) -> bool:
+        # returns False when max_restarts restarts were not enough, leaving the solver mid attempt
+        start = self._start_solve()
+        solved = self._solve(max_restarts)
+        self._finish_solve(solved, start)
+        return solved
+
+    async def solve_async(self, max_restarts:'int|None'=None, timeout:'float|None'=None, yield_every:int=256) -> dict:
+        # solve() for an event loop: control goes back to the loop every yield_every collapses, which is where a
+        # cancelled task stops (with CancelledError, leaving the solver mid attempt). Gives up after max_restarts
+        # restarts or, at the first yield past it, timeout seconds after the call, and returns what it has:
+        # {'solved', 'timed_out', 'restarts', 'result' (state index per node id, -1 while open),
+        # 'possible' (the states each node can still take, (nodes, S) booleans)}
+        assert yield_every > 0
+        end = None if timeout is None else perf_counter() + timeout
+        start = self._start_solve()
+        steps = self._solve_steps(max_restarts, yield_every)
+        solved = timed_out = False
+        try:
+            while True:
+                try:
+                    next(steps)
+                except StopIteration as done:
+                    solved = done.value
+                    break
+                if end is not None and perf_counter() >= end:
+                    timed_out = True
+                    break
+                await asyncio.sleep(0)
+        finally:
+            # a cancelled solve is closed and its statistics finished as well
+            steps.close()
+            self._finish_solve(solved, start)
+        return {'solved': solved, 'timed_out': timed_out, 'restarts': self.restarts, 'result': self.result(),
+                'possible': self.possible()}
+
+    def _start_solve(self) -> 'float|None':
+        # reset the counters of a solve, returns its start time when statistics are on
+        if self.mode == 'bitset' and 'initial' not in self.snapshots:
+            self.save_initial()
+        self.restarts = 0
+        self.backtracks = 0
+        if self.stats is None:
+            return None
+        self.stats = dict.fromkeys(STAT_COUNTERS, 0)
+        if self.mode == 'bitset':
+            self.stats.update(nodes=self.num_nodes, arcs=len(self.indices))
+        else:
+            self.stats.update(nodes=len(self.nodes), arcs=sum(len(nb) for nb in self.adjacencyList.values()))
+        return perf_counter()
+
+    def _finish_solve(self, solved:bool, start:'float|None'):
+        if start is None:
+            return
+        self.stats['solve_s'] = perf_counter() - start
+        self.stats['solved'] = solved
+        self._notify('solve', self.stats)
+
+    def _solve(self, max_restarts:'int|None') -> bool:
+        steps = self._solve_steps(max_restarts, 0)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as done:
+                return done.value
+
+    def _solve_steps(self, max_restarts:'int|None', chunk:int):
+        # the solve loop as a generator that yields after every chunk collapses (never for 0) and returns
+        # whether it solved
+        if self.mode == 'bitset' and self.infeasible:
             return False
-    
-    def solve(self):
+        if self.backtrack_budget > 0:
+            return (yield from self._solve_backtracking(max_restarts, chunk))
+        if (self.kernel == 'numba' and self.propagation == 'neighbor' and self.heuristic == 'count' and self.weights is None
+                and self.group_offsets is None):
+            if self.stats is None:
+                return (yield from self._solve_kernel(max_restarts, chunk))
+            # the kernel counts nothing, so every collapse goes through the methods below, far slower
+            warnings.warn("stats and observe() solve with the python kernel instead of the numba one", RuntimeWarning,
+                          stacklevel=4)
+        collapses = 0
         while not self.uncertain_nodes.empty():
             success = self.propagate()
             if not success:
                 # print("Fail---------")
                 # for name, node in self.nodes.items():
                 #     print(node)
-                self.load_initial()
-                
+                if max_restarts is not None and self.restarts >= max_restarts:
+                    return False
+                self.restarts += 1
+                self._restart()
+            collapses += 1
+            if collapses == chunk:
+                collapses = 0
+                yield
+        return True
 
-    
+    def _solve_kernel(self, max_restarts:'int|None', chunk:int):
+        # the loop of _solve_steps() in wfc_kernel, over the working arrays, the restart snapshot and the state of
+        # the rng; every call of the kernel runs chunk collapses
+        self.compile()
+        queue = self.uncertain_nodes
+        domains, collapsed_state, (heads, next_ids, prev_ids, buckets, size) = self.snapshots[self.restart_snapshot]
+        ints = lambda ids: np.frombuffer(ids, dtype=np.intc)
+        while True:
+            version, mt, gauss = self.rng.getstate()
+            mt_words = np.array(mt[:-1], dtype=np.int64)
+            status, self.restarts, queue.size, pos = wfc_kernel.solve(
+                self.domains, self.collapsed_state, np.asarray(self.priority), np.asarray(self.offsets),
+                np.asarray(self.indices), np.zeros(0, dtype=np.int16) if self.arc_kinds is None else np.asarray(self.arc_kinds),
+                self.allow_masks, ints(queue.heads), ints(queue.next), ints(queue.prev), ints(queue.bucket), queue.size,
+                np.asarray(domains), np.asarray(collapsed_state), ints(heads), ints(next_ids), ints(prev_ids), ints(buckets),
+                size, mt_words, mt[-1], self.restarts, -1 if max_restarts is None else max_restarts, chunk or -1)
+            self.rng.setstate((version, tuple(mt_words.tolist()) + (pos,), gauss))
+            assert status >= 0, "a queued node has no possible state"
+            if status != 2:
+                return status == 1
+            yield
+
+    def solve_parallel(self, workers:'int|None'=None, seed:int=0, attempt_restarts:int=0,
+                       max_attempts:'int|None'=64) -> bool:
+        # race independent attempts in a process pool; attempt k runs solve(attempt_restarts) with its own
+        # random.Random seeded from (seed, k). The lowest numbered successful attempt wins, so the result only
+        # depends on seed, not on the number of workers or their timing. The solution is loaded into this solver.
+        # False once max_attempts attempts failed (None keeps trying), or right away for an infeasible problem
+        if self.mode != 'bitset':
+            raise ValueError("solve_parallel() requires mode='bitset'")
+        if 'initial' not in self.snapshots:
+            self.save_initial()
+        if self.infeasible:
+            return False
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(workers, initializer=_worker_init, initargs=(self._worker_problem(),)) as pool:
+            pending:deque = deque()
+            attempt = 0
+            while True:
+                while len(pending) < 2 * workers and (max_attempts is None or attempt < max_attempts):
+                    pending.append(pool.submit(_worker_attempt, "%d:%d" % (seed, attempt), attempt_restarts))
+                    attempt += 1
+                if not pending:
+                    return False
+                solution = pending.popleft().result()
+                if solution is not None:
+                    for future in pending:
+                        future.cancel()
+                    self.load_solution(_unpack_solution(solution))
+                    return True
+
+    def _worker_problem(self) -> 'bytes|str':
+        # workers map the problem file this solver came from instead of unpickling a copy each
+        return self.problem_path or pickle.dumps(self)
+
+    def solve_many_parallel(self, n:int, workers:'int|None'=None, seed:int=0) -> np.ndarray:
+        # n independent solutions spread over a process pool, solution i is seeded from (seed, i) so the
+        # result matches for any number of workers
+        if self.mode != 'bitset':
+            raise ValueError("solve_many_parallel() requires mode='bitset'")
+        if 'initial' not in self.snapshots:
+            self.save_initial()
+        workers = workers or os.cpu_count() or 1
+        seeds = ["%d:%d" % (seed, i) for i in range(n)]
+        chunks = [seeds[i:i + max(1, -(-n // (4 * workers)))] for i in range(0, n, max(1, -(-n // (4 * workers))))]
+        with ProcessPoolExecutor(workers, initializer=_worker_init, initargs=(self._worker_problem(),)) as pool:
+            results = list(pool.map(_worker_samples, chunks))
+        if not results:
+            return np.empty((0, self.num_nodes), dtype=np.int32)
+        return np.concatenate([_unpack_solution(result) for result in results]).astype(np.int32)
+
+    def save_problem(self, path:str):
+        # write the built problem as it stands in the initial snapshot (state table and rules, node names,
+        # CSR adjacency, initial domains, priorities and bucket queue) to a file load_problem() maps back
+        if self.mode != 'bitset':
+            raise ValueError("save_problem() requires mode='bitset'")
+        if 'initial' not in self.snapshots:
+            self.save_initial()
+        n = self.num_nodes
+        assert not any('\0' in name for name in self.node_names)
+        domains, collapsed_state, queue = self.snapshots['initial']
+        arrays = {
+            'names': np.frombuffer('\0'.join(self.node_names).encode(), dtype=np.uint8),
+            'offsets': self.offsets,
+            'indices': self.indices,
+            'priority': self.priority[:n],
+            'base_domains': self.base_domains,
+            'base_collapsed': self.base_collapsed,
+            'initial_domains': domains,
+            'initial_collapsed': collapsed_state,
+        }
+        if self.arc_kinds is not None:
+            arrays['arc_kinds'] = self.arc_kinds
+        if self.group_offsets is not None:
+            for name in ('group_offsets', 'group_members', 'member_offsets', 'member_groups'):
+                arrays[name] = getattr(self, name)
+        if self.heuristic == 'count':
+            for name, ids in zip(('heads', 'next', 'prev', 'bucket'), queue):
+                arrays['queue_' + name] = np.frombuffer(ids, dtype=np.intc)
+        header = {
+            'states': self.states,
+            'adjacencyAllow': self.adjacencyAllow,
+            'labelAllow': self.labelAllow,
+            'weights': self.weights,
+            'propagation': self.propagation,
+            'backtrack_budget': self.backtrack_budget,
+            'heuristic': self.heuristic,
+            'prune': self.prune,
+            'kernel': self.kernel,
+            'infeasible': self.infeasible,
+            'num_nodes': n,
+            'queue_size': queue[-1],
+            'arrays': dict(),
+        }
+        offset = 0
+        for name, data in arrays.items():
+            offset = -(-offset // PROBLEM_ALIGN) * PROBLEM_ALIGN
+            header['arrays'][name] = (data.dtype.str, data.shape, offset)
+            offset += data.nbytes
+        encoded = json.dumps(header).encode()
+        start = -(-(len(PROBLEM_MAGIC) + 8 + len(encoded)) // PROBLEM_ALIGN) * PROBLEM_ALIGN
+        with open(path, 'wb') as f:
+            f.write(PROBLEM_MAGIC)
+            f.write(np.uint64(len(encoded)).tobytes())
+            f.write(encoded)
+            for name, data in arrays.items():
+                f.write(bytes(start + header['arrays'][name][2] - f.tell()))
+                f.write(np.ascontiguousarray(data).tobytes())
+
+    @classmethod
+    def load_problem(cls, path:str, seed:'int|None'=None) -> 'WaveFunctionCollapse':
+        # map a save_problem() file: adjacency, names, priorities and the initial snapshot stay read-only views of
+        # the file, shared between every process that maps it, only the working domains are copied. The compiled
+        # rule tables are not stored: the constructor rebuilds them from the states and rules in the header (from the
+        # rule cache when the process has compiled the same rules before), which only depends on the number of states.
+        # A file saved with the numba kernel loads with the python one where numba is not installed.
+        with open(path, 'rb') as f:
+            if f.read(len(PROBLEM_MAGIC)) != PROBLEM_MAGIC:
+                raise ValueError("%s is not a problem file" % (path,))
+            length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = json.loads(f.read(length))
+        start = -(-(len(PROBLEM_MAGIC) + 8 + length) // PROBLEM_ALIGN) * PROBLEM_ALIGN
+        mapped = np.memmap(path, dtype=np.uint8, mode='r')
+
+        def view(name:str) -> np.ndarray:
+            dtype, shape, offset = header['arrays'][name]
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape, dtype=np.int64))
+            return mapped[start + offset:start + offset + count * dtype.itemsize].view(dtype).reshape(shape)
+
+        wfc = cls(header['states'], header['adjacencyAllow'], mode='bitset', propagation=header['propagation'],
+                  backtrack_budget=header['backtrack_budget'], labelAllow=header['labelAllow'], seed=seed,
+                  weights=header['weights'], heuristic=header['heuristic'], prune=header['prune'],
+                  kernel='auto' if wfc_kernel.numba is None else header['kernel'])
+        wfc.infeasible = header['infeasible']
+        n = header['num_nodes']
+        wfc.node_names = bytes(view('names')).decode().split('\0') if n else []
+        wfc.node_index = dict(zip(wfc.node_names, range(n)))
+        wfc.offsets = view('offsets')
+        wfc.indices = view('indices')
+        wfc.arc_kinds = view('arc_kinds') if 'arc_kinds' in header['arrays'] else None
+        wfc.parallel_arcs = wfc._has_parallel_arcs()
+        if 'group_offsets' in header['arrays']:
+            for name in ('group_offsets', 'group_members', 'member_offsets', 'member_groups'):
+                setattr(wfc, name, view(name))
+        wfc.priority = view('priority')
+        wfc.base_domains = view('base_domains')
+        wfc.base_collapsed = view('base_collapsed')
+        domains, collapsed_state = view('initial_domains'), view('initial_collapsed')
+        wfc.domains = np.array(domains)
+        wfc.collapsed_state = np.array(collapsed_state)
+        if wfc.heuristic == 'count':
+            queue = [array('i', bytes(view('queue_' + name))) for name in ('heads', 'next', 'prev', 'bucket')]
+            wfc.uncertain_nodes.restore(tuple(queue) + (header['queue_size'],))
+        else:
+            open_ids = np.flatnonzero(collapsed_state < 0)
+            wfc.uncertain_nodes.add_many(open_ids.tolist(), wfc._queue_keys(domains[open_ids], open_ids))
+        wfc.snapshots['initial'] = (domains, collapsed_state, wfc.uncertain_nodes.snapshot())
+        wfc.problem_path = path
+        return wfc
+
+    def result(self) -> np.ndarray:
+        # state index per node id (nodes in the order they were added), -1 where the node is not collapsed yet
+        if self.mode == 'bitset':
+            return self.collapsed_state[:self.num_nodes].copy()
+        state_index = {state: i for i, state in enumerate(self.states)}
+        return np.array([state_index.get(node.collapsed, -1) for node in self.nodes.values()], dtype=np.int32)
+
+    def possible(self) -> np.ndarray:
+        # (nodes, S) booleans of the states each node id can still take, a single one for collapsed nodes
+        if self.mode == 'bitset':
+            return unpack_masks(self.domains[:self.num_nodes], len(self.states))
+        num_bytes = max(1, -(-len(self.states) // 8))
+        masks = [node.mask if node.collapsed is None else self.state_bits[node.collapsed] for node in self.nodes.values()]
+        rows = np.frombuffer(b''.join(mask.to_bytes(num_bytes, 'little') for mask in masks), dtype=np.uint8)
+        return np.unpackbits(rows.reshape(-1, num_bytes), axis=1, bitorder='little')[:, :len(self.states)].astype(bool)
+
+    def load_solution(self, solution:np.ndarray):
+        # put a state index per node (as returned by solve_many) into the solver as a finished solve
+        n = self.num_nodes
+        self.domains[:n] = self.state_masks[solution]
+        self.collapsed_state[:n] = solution
+        while not self.uncertain_nodes.empty():
+            self.uncertain_nodes.pop()
+
+    def pin(self, name:str, state:str):
+        # force a node to a state from the next resolve() on, until unpin()
+        if self.mode != 'bitset':
+            raise ValueError("pin() requires mode='bitset'")
+        node_id = self.node_index[name]
+        self.pins[node_id] = self.state_index[state]
+        self.released.add(node_id)
+
+    def unpin(self, name:str):
+        if self.mode != 'bitset':
+            raise ValueError("unpin() requires mode='bitset'")
+        node_id = self.node_index[name]
+        self.pins.pop(node_id, None)
+        self.released.add(node_id)
+
+    def release(self, names:'Iterable[str]'):
+        # mark nodes to be solved again by the next resolve()
+        if self.mode != 'bitset':
+            raise ValueError("release() requires mode='bitset'")
+        self.released.update(self.node_index[name] for name in names)
+
+    def resolve(self, radius:int=1, max_restarts:int=8) -> bool:
+        # re-solve the released and (un)pinned nodes plus everything within radius hops of them, keeping the rest
+        # of the current solution. The region goes back to its domains as added, is pruned by the collapsed nodes
+        # around it and solved with restarts that only reload the region; once max_restarts are used up the
+        # radius grows until the whole graph is reopened. Returns False when even that fails.
+        if self.mode != 'bitset':
+            raise ValueError("resolve() requires mode='bitset'")
+        if 'initial' not in self.snapshots:
+            self.save_initial()
+        released = np.array(sorted(self.released), dtype=np.int64)
+        restarts = 0
+        region = self._region(released, radius)
+        while True:
+            if self._reopen(region):
+                self.save_snapshot('edit')
+                self.restart_snapshot = 'edit'
+                try:
+                    solved = self.solve(max_restarts)
+                finally:
+                    self.restart_snapshot = 'initial'
+                    self.drop_snapshot('edit')
+                restarts += self.restarts
+                if solved:
+                    self.restarts = restarts
+                    self.released.clear()
+                    return True
+            if region.all():
+                self.restarts = restarts
+                return False
+            radius = 2 * radius + 1
+            grown = self._region(released, radius)
+            # a region that stopped growing is cut off from the rest of the graph, reopen everything
+            region = grown if grown.sum() > region.sum() else np.ones_like(region)
+
+    def _region(self, node_ids:np.ndarray, radius:int) -> np.ndarray:
+        # boolean mask of the nodes within radius hops of node_ids, expanded one CSR frontier at a time;
+        # members of a common all-different group are one hop apart
+        region = np.zeros(self.num_nodes, dtype=bool)
+        region[node_ids] = True
+        frontier = node_ids
+        for _ in range(radius):
+            frontier_ids = [self.indices[self._arcs(frontier)]]
+            if self.group_offsets is not None:
+                for group in set(self._groups_of(frontier.tolist())):
+                    frontier_ids.append(self.group_members[self.group_offsets[group]:self.group_offsets[group + 1]])
+            frontier = np.unique(np.concatenate(frontier_ids))
+            frontier = frontier[~region[frontier]]
+            if not len(frontier):
+                break
+            region[frontier] = True
+        return region
+
+    def _arcs(self, node_ids:np.ndarray) -> np.ndarray:
+        # CSR positions of the arcs leaving node_ids, node by node
+        starts, ends = self.offsets[node_ids], self.offsets[node_ids + 1]
+        lengths = ends - starts
+        return np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+
+    def _collapsed_consistent(self, node_ids:np.ndarray) -> bool:
+        # the rules hold between every collapsed node of node_ids and its collapsed neighbors; propagation only
+        # restricts uncertain neighbors, so it never looks at these arcs
+        node_ids = node_ids[self.collapsed_state[node_ids] >= 0]
+        arcs = self._arcs(node_ids)
+        states = np.repeat(self.collapsed_state[node_ids], np.diff(self.offsets)[node_ids])
+        nb_states = self.collapsed_state[self.indices[arcs]]
+        kinds = np.zeros(len(arcs), dtype=np.int16) if self.arc_kinds is None else self.arc_kinds[arcs]
+        both = nb_states >= 0
+        states, nb_states, kinds = states[both], nb_states[both], kinds[both]
+        # an unlabelled edge must allow both ways, the reverse kind of a label is the transpose of its forward kind
+        allowed = self.compatible[kinds, states, nb_states] & ((kinds > 0) | self.compatible[0, nb_states, states])
+        return bool(allowed.all())
+
+    def _reopen(self, region:np.ndarray) -> bool:
+        # put the region back to its domains as added (or pinned) and prune it by every collapsed or narrowed
+        # node in and around it, False on a contradiction
+        ids = np.flatnonzero(region)
+        for node_id in ids.tolist():
+            self.uncertain_nodes.remove(node_id)
+        self.domains[ids] = self.base_domains[ids]
+        self.collapsed_state[ids] = self.base_collapsed[ids]
+        for node_id, state in self.pins.items():
+            if region[node_id]:
+                self.domains[node_id] = self.state_masks[state]
+                self.collapsed_state[node_id] = state
+        open_ids = ids[self.collapsed_state[ids] < 0]
+        for node_id, key in zip(open_ids.tolist(), self._queue_keys(self.domains[open_ids], open_ids)):
+            self.uncertain_nodes.add(node_id, key)
+        if not self._collapsed_consistent(ids):
+            return False # a pin (or a given) clashes with a collapsed neighbor, only a larger region can help
+
+        around = np.flatnonzero(self._region(ids, 1))
+        sources = around[(self.collapsed_state[around] >= 0) | (self.domains[around] != self.full_mask).any(axis=1)]
+        for node_id in sources.tolist():
+            if self.propagation == 'ac3':
+                if not self._ac3_bitset(node_id):
+                    return False
+            elif self._restrict_neighbors(node_id, self.support_mask(self.domains[node_id])) is None:
+                return False
+        if self.group_offsets is not None:
+            return self._propagate_groups(self._groups_of(ids.tolist())) is not None
+        return True
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['observers'] = dict() # callbacks stay with this process
+        if state.get('rng') is random:
+            state['rng'] = None # the global random module can not be pickled
+        return state
+
+    def __setstate__(self, state):
+        if 'rng' in state and state['rng'] is None:
+            state['rng'] = random
+        self.__dict__.update(state)
+
+
+# process pool workers keep one unpickled copy of the problem each
+_worker_wfc:'WaveFunctionCollapse|None' = None
+
+def _worker_init(problem:'bytes|str'):
+    # a pickled solver, or the path of a problem file every worker maps
+    global _worker_wfc
+    _worker_wfc = WaveFunctionCollapse.load_problem(problem) if type(problem) == str else pickle.loads(problem)
+
+def _pack_solution(solution:np.ndarray, num_states:int) -> tuple:
+    # smallest integer type that fits the state indices, shipped as raw bytes
+    dtype = np.int8 if num_states < 128 else np.int16 if num_states < 2 ** 15 else np.int32
+    return solution.shape, np.dtype(dtype).str, solution.astype(dtype).tobytes()
+
+def _unpack_solution(packed:tuple) -> np.ndarray:
+    shape, dtype, data = packed
+    return np.frombuffer(data, dtype=dtype).reshape(shape).astype(np.int32)
+
+def _worker_attempt(seed:str, max_restarts:int) -> 'tuple|None':
+    wfc = _worker_wfc
+    wfc.rng = random.Random(seed)
+    wfc.load_initial()
+    if not wfc.solve(max_restarts):
+        return None
+    return _pack_solution(wfc.collapsed_state[:wfc.num_nodes], len(wfc.states))
+
+def _worker_samples(seeds:'list[str]') -> tuple:
+    wfc = _worker_wfc
+    return _pack_solution(wfc.solve_many(len(seeds), seeds, batched=False), len(wfc.states))
+
+def _select_bits(rows:np.ndarray, picks:np.ndarray, num_states:int) -> np.ndarray:
+    # index of the picks[i]-th set bit of every (num_words,) row
+    states = np.arange(num_states)
+    bits = (rows[:, states // WORD_BITS] >> (states % WORD_BITS).astype(np.uint64)) & np.uint64(1)
+    return np.argmax(np.cumsum(bits, axis=1) > picks[:, None], axis=1)
+
+def _select_weighted(rows:np.ndarray, points:np.ndarray, weights:np.ndarray) -> np.ndarray:
+    # state of every (num_words,) row hit by points[i] (in [0, 1)) on the cumulative weight of its set bits
+    states = np.arange(len(weights))
+    bits = (rows[:, states // WORD_BITS] >> (states % WORD_BITS).astype(np.uint64)) & np.uint64(1)
+    cumulative = np.cumsum(bits * weights, axis=1)
+    # rows with only states of weight 0 left draw among them uniformly
+    unweighted = cumulative[:, -1] == 0
+    cumulative[unweighted] = np.cumsum(bits[unweighted], axis=1)
+    return np.argmax(cumulative > (points * cumulative[:, -1])[:, None], axis=1)
+
+def restarts_avoided(build:'Callable[[str], WaveFunctionCollapse]', trials:int=10, seed:int=0) -> 'dict[str,float]':
+    # build(propagation) returns a ready to solve bitset WaveFunctionCollapse, e.g.
+    # lambda p: Sudoku(9, mode='bitset', propagation=p).wfc
+    # both propagation modes get the same seeds, the report is the mean restarts per solution
+    report = dict()
+    for propagation in ('neighbor', 'ac3'):
+        restarts = 0
+        for trial in range(trials):
+            wfc = build(propagation)
+            random.seed(seed + trial)
+            wfc.solve()
+            restarts += wfc.restarts
+        report[propagation] = restarts / trials
+    report['avoided'] = report['neighbor'] - report['ac3']
+    return report
 
 
 if __name__ == '__main__':
@@ -1,9 +1,9 @@
 from cWFC import *
+from render import stamp, save_image, show_image
 import numpy as np
-import matplotlib.pyplot as plt
 
 class CheckerGen:
-    def __init__(self, size:tuple[int]):
+    def __init__(self, size:tuple[int], **wfc_options):
         states = ['B','W']
         # N is for blank, H is horizontal pipe, V is vertical pipe, C is junction pipe, and F and G are special states for the guide nodes in place of N
         adjacencyRules = {
@@ -11,50 +11,39 @@ class CheckerGen:
             'W': ['B']
         }
 
-        self.wfc = WaveFunctionCollapse(states, adjacencyRules)
+        wfc_options.setdefault('mode', KERNEL_MODE) # solved by the numba kernel where it is installed
+        self.wfc = WaveFunctionCollapse(states, adjacencyRules, **wfc_options)
         self.size = size # (row, column)
 
-        for row in range(size[0]):
-            for col in range(size[1]):
-                name = "%d,%d" % (row, col)
-                self.wfc.addNode(name)
-                if row > 0:
-                    self.wfc.addEdge(name, "%d,%d" % (row - 1, col))
-                if col > 0:
-                    self.wfc.addEdge(name, "%d,%d" % (row, col - 1))
+        ids = self.wfc.add_nodes("%d,%d" % (row, col) for row in range(size[0]) for col in range(size[1])).reshape(size)
+        self.ids = ids # node id of every cell
+        self.wfc.add_edges(ids[1:, :], ids[:-1, :])
+        self.wfc.add_edges(ids[:, 1:], ids[:, :-1])
         self.wfc.save_initial()
     
     def generate(self):
         self.wfc.solve()
 
     def as_mat(self):
-        mat = np.full(self.size, "?")
-        for name, node in self.wfc.nodes.items():
-            row, col = name.split(",")
-            row = int(row)
-            col = int(col)
-            if node.collapsed is not None:
-                mat[row,col] = node.collapsed
-        return mat
+        # undecided cells index the trailing '?'
+        return np.array(self.wfc.states + ['?'])[self.wfc.result()[self.ids]]
 
     def __str__(self):
         return self.as_mat().__str__()
 
+    def image(self) -> np.ndarray:
+        grid = self.wfc.result()[self.ids]
+        assert (grid >= 0).all()
+        colors = {'B': (0,0,0), 'W': (255,255,255)}
+        tiles = np.array([colors[state] for state in self.wfc.states], dtype=np.uint8).reshape(-1, 1, 1, 3)
+        return stamp(grid, tiles)
+
     def show_img(self):
-        rows, cols = self.size
-        mat = np.full((rows, cols, 3), (-1,-1,-1))
-        for row in range(rows):
-            for col in range(cols):
-                name = "%d,%d" % (row, col)
-                color = self.wfc.nodes[name].collapsed
-                assert color is not None
-                if color == 'B':
-                    mat[row,col,:] = (0,0,0)
-                if color == 'W':
-                    mat[row,col,:] = (255,255,255)
-
-        plt.imshow(mat)
-        plt.waitforbuttonpress()
+        show_image(self.image())
+
+    def save_img(self, path:str):
+        # .png or .npy
+        save_image(path, self.image())
 
 if __name__ == "__main__":
     p = CheckerGen((12,12))
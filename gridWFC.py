@@ -0,0 +1,287 @@
+import random
+import numpy as np
+from array import array
+from typing import Iterator
+from cWFC import IndexSort, WaveFunctionCollapse
+
+# neighborhood stencils as (row, col) offsets, 'sudoku' is handled as row/column/box groups instead of offsets
+STENCILS = {
+    'von_neumann': ((-1, 0), (1, 0), (0, -1), (0, 1)),
+    'moore': ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)),
+}
+STENCILS[4] = STENCILS['von_neumann']
+STENCILS[8] = STENCILS['moore']
+
+class GridWFC:
+    # wave function collapse over a regular 2D lattice, the whole wave is one (H, W, S) boolean array inside a
+    # one cell border, so a neighbor is a fixed step in the flat cell index. Propagation revises the stencil
+    # neighbors of the changed cells as whole arrays and the open cells wait in the bucket queue of the bitset
+    # solver, so a collapse costs as much as the cells it changes, not as much as the grid
+    def __init__(self, shape:'tuple[int,int]', states:'list[str]', adjacencyAllow:'dict[str,list[str]]|None'=None,
+                 stencil='von_neumann', offsetAllow:'dict[tuple[int,int],dict[str,list[str]]]|None'=None,
+                 seed:'int|None'=None, max_restarts:'int|None'=None):
+        # adjacencyAllow applies to every neighbor of the stencil, offsetAllow[(dy, dx)][s] lists the states the
+        # cell at (y + dy, x + dx) may take when (y, x) is in state s, the opposite offset gets the transposed rule
+        self.shape = tuple(shape)
+        self.states = list(states)
+        self.state_index:dict[str,int] = {state: i for i, state in enumerate(self.states)}
+        self.adjacencyAllow = dict(adjacencyAllow or {})
+        self.offsetAllow = dict(offsetAllow or {})
+        self.rng = np.random.default_rng(seed)
+        self.max_restarts = max_restarts
+        self.restarts = 0
+
+        num_states = len(self.states)
+        base = self._rule_matrix(self.adjacencyAllow)
+        if stencil == 'sudoku':
+            assert self.shape[0] == self.shape[1] and int(np.sqrt(self.shape[0])) ** 2 == self.shape[0]
+            assert not self.offsetAllow
+            self.groups = True
+            self.group_rule = base.astype(np.float32)
+            offsets = ()
+        else:
+            self.groups = False
+            offsets = STENCILS[stencil] if not isinstance(stencil, (list, tuple)) else tuple(stencil)
+        self.offsets:dict[tuple[int,int],np.ndarray] = dict()
+        for dy, dx in offsets:
+            assert max(abs(dy), abs(dx)) == 1, "stencil offsets must reach the adjacent ring only"
+            rule = base.copy()
+            if (dy, dx) in self.offsetAllow:
+                rule &= self._rule_matrix(self.offsetAllow[(dy, dx)])
+            if (-dy, -dx) in self.offsetAllow:
+                rule &= self._rule_matrix(self.offsetAllow[(-dy, -dx)]).T
+            self.offsets[(dy, dx)] = rule.astype(np.float32)
+        # flat index steps of the stencil beside their (K, S, S) rules, border cells are never revised
+        height, width = self.shape
+        steps = np.array(list(self.offsets), dtype=np.int64).reshape(-1, 2)
+        self.steps = steps[:, 0] * (width + 2) + steps[:, 1]
+        self.rules = np.array(list(self.offsets.values()), dtype=np.float32).reshape(-1, num_states, num_states)
+        self.allowed = self.rules > 0
+        self.border = np.ones((height + 2, width + 2), dtype=bool)
+        self.border[1:-1, 1:-1] = False
+        self.border = self.border.ravel()
+
+        self.initial_wave = np.ones(self.shape + (num_states,), dtype=bool)
+        self.wave:'np.ndarray|None' = None # (H, W, S) view of cells
+        self.counts:'np.ndarray|None' = None # (H, W) view of cell_counts
+        self.cells:'np.ndarray|None' = None # (H + 2) * (W + 2) rows of S booleans, the border included
+        self.cell_counts:'np.ndarray|None' = None
+        self.queue = IndexSort(num_states)
+
+    def _rule_matrix(self, rules:'dict[str,list[str]]') -> np.ndarray:
+        # rule[s, t] is True when a neighbor of a cell in state s may be in state t
+        rule = np.ones((len(self.states), len(self.states)), dtype=bool)
+        for state, adj_states in rules.items():
+            rule[self.state_index[state]] = False
+            rule[self.state_index[state], [self.state_index[adj] for adj in adj_states]] = True
+        return rule
+
+    def assign(self, row:int, col:int, assign:'str|tuple[str]'):
+        # narrow the initial domain of a cell to one state or a tuple of states
+        if type(assign) == str:
+            assign = (assign,)
+        self.initial_wave[row, col] = False
+        self.initial_wave[row, col, [self.state_index[s] for s in assign]] = True
+
+    def _propagate(self, frontier:np.ndarray, state:'int|None'=None) -> bool:
+        # arc consistency from the cells whose domain shrank, one frontier at a time: the stencil neighbors of the
+        # frontier lose every state it does not support and the ones that lost one are the next frontier.
+        # state is given when the frontier is a single cell just collapsed to it. False on a contradiction
+        if self.groups:
+            if not self._propagate_groups():
+                return False
+            self._rebuild_queue()
+            return True
+        cells = self.cells
+        # past this many narrowed cells the queue is rebuilt with array operations instead of moving them one by one
+        bulk = len(cells) // 64
+        moved = 0
+        while len(frontier):
+            # (K, m) neighbors and (K, m, S) support of the frontier, without the ones on the border
+            targets = (frontier + self.steps[:, None]).ravel()
+            if state is None:
+                support = ((cells[frontier] @ self.rules) > 0).reshape(len(targets), -1)
+            else:
+                support, state = self.allowed[:, state], None
+            inside = ~self.border[targets]
+            targets, support = targets[inside], support[inside]
+            old = cells[targets]
+            np.logical_and.at(cells, targets, support)
+            frontier = targets[(cells[targets] != old).any(axis=1)]
+            if len(frontier) > 1:
+                frontier = np.unique(frontier)
+            self.cell_counts[frontier] = counts = cells[frontier].sum(axis=1)
+            if not counts.all():
+                return False
+            moved += len(frontier)
+            if moved <= bulk:
+                self._requeue(frontier)
+        if moved > bulk:
+            self._rebuild_queue()
+        return True
+
+    def _rebuild_queue(self):
+        # the bucket queue of every open cell as IndexSort.snapshot() arrays, each bucket linked in cell order
+        num_states = len(self.states)
+        open_cells = np.flatnonzero((self.cell_counts > 1) & ~self.border)
+        buckets = np.minimum(self.cell_counts[open_cells], num_states)
+        order = np.argsort(buckets, kind='stable')
+        open_cells, buckets = open_cells[order], buckets[order]
+        next_ids = np.full(len(self.cells), -1, dtype=np.intc)
+        prev_ids = np.full(len(self.cells), -1, dtype=np.intc)
+        bucket = np.full(len(self.cells), -1, dtype=np.intc)
+        linked = buckets[1:] == buckets[:-1]
+        next_ids[open_cells[:-1][linked]] = open_cells[1:][linked]
+        prev_ids[open_cells[1:][linked]] = open_cells[:-1][linked]
+        bucket[open_cells] = buckets
+        heads = np.full(num_states + 1, -1, dtype=np.intc)
+        first = np.flatnonzero(np.diff(buckets, prepend=-1))
+        heads[buckets[first]] = open_cells[first]
+        self.queue.restore(tuple(array('i', ids.tobytes()) for ids in (heads, next_ids, prev_ids, bucket))
+                           + (len(open_cells),))
+
+    def _requeue(self, frontier:np.ndarray):
+        # move narrowed cells to the bucket of their new count, decided ones leave the queue
+        for cell, count in zip(frontier.tolist(), self.cell_counts[frontier].tolist()):
+            if count > 1:
+                self.queue.update(cell, count)
+            else:
+                self.queue.remove(cell)
+
+    def _propagate_groups(self) -> bool:
+        # sudoku style groups: every cell must be supported by every other cell of its row, column and box
+        n = self.shape[0]
+        b = int(np.sqrt(n))
+        while True:
+            support = (self.wave @ self.group_rule) > 0
+            allowed = self._all_others(support, axis=1) & self._all_others(support, axis=0)
+            boxes = support.reshape(b, b, b, b, -1).transpose(0, 2, 1, 3, 4).reshape(b, b, n, -1)
+            boxes = self._all_others(boxes, axis=2).reshape(b, b, b, b, -1).transpose(0, 2, 1, 3, 4).reshape(n, n, -1)
+            new = self.wave & allowed & boxes
+            if (new == self.wave).all():
+                return True
+            self.wave[...] = new
+            self.counts[...] = new.sum(axis=2)
+            if not self.counts.all():
+                return False
+
+    @staticmethod
+    def _all_others(support:np.ndarray, axis:int) -> np.ndarray:
+        # AND of support over every other cell along axis, from exclusive prefix and suffix ANDs
+        size = support.shape[axis]
+        prefix = np.logical_and.accumulate(support, axis=axis)
+        suffix = np.flip(np.logical_and.accumulate(np.flip(support, axis=axis), axis=axis), axis=axis)
+        result = np.ones_like(support)
+        before = [slice(None)] * support.ndim
+        after = [slice(None)] * support.ndim
+        before[axis], after[axis] = slice(1, size), slice(0, size - 1)
+        result[tuple(before)] &= prefix[tuple(after)]
+        result[tuple(after)] &= suffix[tuple(before)]
+        return result
+
+    def _reset(self) -> bool:
+        # the initial wave with everything its narrowed cells rule out, and the queue of its open cells
+        height, width = self.shape
+        padded = np.ones((height + 2, width + 2, len(self.states)), dtype=bool)
+        padded[1:-1, 1:-1] = self.initial_wave
+        self.cells = padded.reshape(-1, len(self.states))
+        self.cell_counts = self.cells.sum(axis=1)
+        self.wave = padded[1:-1, 1:-1]
+        self.counts = self.cell_counts.reshape(height + 2, width + 2)[1:-1, 1:-1]
+        if not self.counts.all():
+            return False
+        self._rebuild_queue()
+        if self.initial_wave.all():
+            return True
+        return self._propagate(np.flatnonzero(~self.border))
+
+    def _collapse(self) -> 'tuple[int,int]|None':
+        # a lowest count cell, collapsed to a uniformly random remaining state; returns its flat index and state
+        if self.queue.empty():
+            return None
+        cell = self.queue.pop()
+        possible = self.cells[cell].nonzero()[0]
+        state = int(possible[self.rng.integers(len(possible))])
+        self.cells[cell] = False
+        self.cells[cell, state] = True
+        self.cell_counts[cell] = 1
+        return cell, state
+
+    def solve(self) -> np.ndarray:
+        # returns the (H, W) array of state indices, restarting from the propagated initial wave on contradictions;
+        # RuntimeError when the assigned cells contradict each other or max_restarts restarts were not enough
+        self.restarts = 0
+        if not self._reset():
+            raise RuntimeError("the assigned cells contradict each other")
+        start = self.cells.copy(), self.cell_counts.copy(), self.queue.snapshot()
+        while True:
+            collapsed = self._collapse()
+            if collapsed is None:
+                return self.result()
+            cell, state = collapsed
+            if self._propagate(np.array([cell]), state):
+                continue
+            if self.max_restarts is not None and self.restarts >= self.max_restarts:
+                raise RuntimeError("no solution found within %d restarts" % self.max_restarts)
+            self.restarts += 1
+            self.cells[...], self.cell_counts[...] = start[:2]
+            self.queue.restore(start[2])
+
+    def result(self) -> np.ndarray:
+        # state index per cell, -1 where the cell is not decided yet
+        return np.where(self.counts == 1, self.wave.argmax(axis=2), -1)
+
+    def as_mat(self) -> np.ndarray:
+        # undecided cells index the trailing '?'
+        return np.array(self.states + ['?'])[self.result()]
+
+
+def stream_rows(width:int, chunk_rows:int, states:'list[str]', adjacencyAllow:'dict[str,list[str]]|None'=None,
+                stencil='von_neumann', offsetAllow:'dict[tuple[int,int],dict[str,list[str]]]|None'=None,
+                seed:'int|None'=None, max_restarts:'int|None'=None, kernel:str='auto') -> 'Iterator[np.ndarray]':
+    # endless grid of the given width, solved and yielded as (chunk_rows, width) arrays of state indices;
+    # only one chunk plus the last finished row stays in memory, and that row is pinned as the first row of
+    # the next chunk so consecutive chunks fit together. Every chunk is a bitset mode WaveFunctionCollapse with one
+    # edge label per stencil direction, so it is solved by the numba kernel when that is installed
+    assert stencil != 'sudoku', "groups span the whole grid and can not be streamed"
+    rules = GridWFC((1, 1), states, adjacencyAllow, stencil, offsetAllow).offsets
+    # an offset and its opposite are one label: the pair must fit the rules of both ends
+    steps = sorted({max((dy, dx), (-dy, -dx)) for dy, dx in rules})
+    labelAllow = dict()
+    for dy, dx in steps:
+        allowed = np.ones((len(states), len(states)), dtype=bool)
+        if (dy, dx) in rules:
+            allowed &= rules[(dy, dx)] > 0
+        if (-dy, -dx) in rules:
+            allowed &= (rules[(-dy, -dx)] > 0).T
+        labelAllow["%d,%d" % (dy, dx)] = {state: [states[t] for t in np.flatnonzero(row)] for state, row in zip(states, allowed)}
+    seeds = random.Random(seed)
+    last = None
+    while True:
+        wfc = WaveFunctionCollapse(states, {}, mode='bitset', labelAllow=labelAllow, seed=seeds.getrandbits(64),
+                                   kernel=kernel)
+        if last is not None:
+            # the first chunk has no row above it, later ones start with the previous bottom row
+            for col, state in enumerate(last.tolist()):
+                wfc.addNode(str(col), states[state])
+        wfc.add_nodes(chunk_rows * width)
+        ids = np.arange(wfc.num_nodes).reshape(-1, width)
+        rows = len(ids)
+        for dy, dx in steps:
+            src = ids[max(-dy, 0):rows - max(dy, 0), max(-dx, 0):width - max(dx, 0)]
+            dst = ids[max(dy, 0):rows + min(dy, 0), max(dx, 0):width + min(dx, 0)]
+            wfc.add_edges(src, dst, "%d,%d" % (dy, dx))
+        wfc.save_initial()
+        if not wfc.solve(max_restarts):
+            raise RuntimeError("no solution for the next chunk within %s restarts" % (max_restarts,))
+        result = wfc.result()[ids[rows - chunk_rows:]]
+        last = result[-1]
+        yield result
+
+
+if __name__ == '__main__':
+    import time
+    start = time.time()
+    grid = GridWFC((1000, 1000), ['B', 'W'], {'B': ['W'], 'W': ['B']}, seed=0)
+    result = grid.solve()
+    print("1000x1000 checkerboard in %.2fs" % (time.time() - start))
@@ -1,10 +1,10 @@
 from cWFC import *
+from render import stamp, save_image, show_image
 import numpy as np
-import matplotlib.pyplot as plt
 import graphviz
 
 class PipeGen:
-    def __init__(self, size:tuple[int]):
+    def __init__(self, size:tuple[int], **wfc_options):
         states = ['N','H','V','C','F','G']
         # N is for blank, H is horizontal pipe, V is vertical pipe, C is junction pipe, and F and G are special states for the guide nodes in place of N
         adjacencyRules = {
@@ -16,68 +16,54 @@ class PipeGen:
             'G': ['N','H'], # G: (NNNNNHNNHNNHHHN)^T
         }
 
-        self.wfc = WaveFunctionCollapse(states, adjacencyRules)
+        wfc_options.setdefault('mode', KERNEL_MODE) # solved by the numba kernel where it is installed
+        self.wfc = WaveFunctionCollapse(states, adjacencyRules, **wfc_options)
         self.size = size # (row, column)
 
         # set up 'guide' nodes
-        for row in range(size[0]):
-            name = "h%d" % (row)
-            self.wfc.addNode(name, ('F', 'H'))
-        for col in range(size[1]):
-            name = "v%d" % (col)
-            self.wfc.addNode(name, ('G', 'V'))
+        h_ids = self.wfc.add_nodes(("h%d" % (row) for row in range(size[0])), ('F', 'H'))
+        v_ids = self.wfc.add_nodes(("v%d" % (col) for col in range(size[1])), ('G', 'V'))
 
-        for row in range(size[0]):
-            for col in range(size[1]):
-                name = "%d,%d" % (row, col)
-                self.wfc.addNode(name, ('N','H','V','C'))
-                # if row > 0:
-                #     self.wfc.addEdge(name, "%d,%d" % (row - 1, col))
-                # if col > 0:
-                #     self.wfc.addEdge(name, "%d,%d" % (row, col - 1))
-                self.wfc.addEdge(name, "h%d" % (row))
-                self.wfc.addEdge(name, "v%d" % (col))
+        ids = self.wfc.add_nodes(("%d,%d" % (row, col) for row in range(size[0]) for col in range(size[1])), ('N','H','V','C')).reshape(size)
+        self.ids = ids # node id of every cell
+        self.wfc.add_edges(ids, np.broadcast_to(h_ids[:, None], size))
+        self.wfc.add_edges(ids, np.broadcast_to(v_ids[None, :], size))
         self.wfc.save_initial()
     
     def generate(self):
         self.wfc.solve()
 
     def as_mat(self):
-        mat = np.full(self.size, "?")
-        for name, node in self.wfc.nodes.items():
-            if name[0] == 'v' or name[0] == 'h':
-                continue
-            row, col = name.split(",")
-            row = int(row)
-            col = int(col)
-            if node.collapsed is not None:
-                mat[row,col] = node.collapsed
-        return mat
+        # undecided cells index the trailing '?'
+        return np.array(self.wfc.states + ['?'])[self.wfc.result()[self.ids]]
 
     def __str__(self):
         return self.as_mat().__str__()
 
-    def show_img(self):
+    def image(self) -> np.ndarray:
+        # 3x3 pixels per cell on a checkered background, the tiles of the shaded cells come after the plain ones
+        grid = self.wfc.result()[self.ids]
+        assert (grid >= 0).all()
         rows, cols = self.size
-        mat = np.full((rows * 3, cols * 3, 3), (255,255,255))
-        for row in range(rows):
-            for col in range(cols):
-                if row % 2 == col % 2:
-                    mat[row * 3: row * 3 + 3, col * 3: col * 3 + 3,:] = (213,223,249)
-                name = "%d,%d" % (row, col)
-                pipe_type = self.wfc.nodes[name].collapsed
-                assert pipe_type is not None
-                if pipe_type == 'H' or pipe_type == 'C':
-                    # draw a horizontal line
-                    mat[row * 3 + 1, col * 3: col * 3 + 3,:] = (0,0,0)
-                if pipe_type == 'V' or pipe_type == 'C':
-                    # draw a vertical line
-                    mat[row * 3: row * 3 + 3, col * 3 + 1,:] = (0,0,0)
+        tiles = np.empty((2, len(self.wfc.states), 3, 3, 3), dtype=np.uint8)
+        tiles[0] = (255,255,255)
+        tiles[1] = (213,223,249)
+        for i, pipe_type in enumerate(self.wfc.states):
+            if pipe_type == 'H' or pipe_type == 'C':
+                # draw a horizontal line
+                tiles[:, i, 1, :] = (0,0,0)
+            if pipe_type == 'V' or pipe_type == 'C':
+                # draw a vertical line
+                tiles[:, i, :, 1] = (0,0,0)
+        shaded = np.add.outer(np.arange(rows), np.arange(cols)) % 2 == 0
+        return stamp(grid + shaded * len(self.wfc.states), tiles.reshape(-1, 3, 3, 3))
+
+    def show_img(self):
+        show_image(self.image())
 
-        plt.imshow(mat)
-        plt.tick_params(left = False, right = False , labelleft = False , 
-                labelbottom = False, bottom = False) 
-        plt.waitforbuttonpress()
+    def save_img(self, path:str):
+        # .png or .npy
+        save_image(path, self.image())
 
     def visualize_rules(self):
         dot = graphviz.Graph(strict=True)
@@ -93,9 +79,6 @@ if __name__ == "__main__":
     p.generate()
     p.show_img()
     # p.visualize_rules()
-    # mat = p.as_mat().astype(int)
-    # np.savetxt("classic WFC/result_save.txt", mat, fmt="%10.0f")
-    # plt.imshow(mat)
-    # plt.waitforbuttonpress()
+    # p.save_img("pipes.png")
 
 
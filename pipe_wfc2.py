@@ -1,11 +1,13 @@
 from cWFC import *
+from gridWFC import stream_rows
+from render import stamp, save_image, show_image
 import numpy as np
-import matplotlib.pyplot as plt
 
 # demonstration of using auxiliary nodes and states to denote direction
+# directed=True builds the same grid with one node per cell and 'R'/'D' labelled edges instead, which needs mode='bitset'
 
 class PipeGen:
-    def __init__(self, size:tuple[int], alt=False):
+    def __init__(self, size:tuple[int], alt=False, directed=False, **wfc_options):
         # UP-RIGHT-DOWN-LEFT, so 0000 is blank, and 1111 is a cross, and 1100 is a vertical line
         
         self.direction_index = {
@@ -34,6 +36,12 @@ class PipeGen:
                 '1111', # ╬
             )
         
+        # solved by the numba kernel where it is installed, edge labels need the bitset mode anyway
+        wfc_options.setdefault('mode', 'bitset' if directed else KERNEL_MODE)
+        if directed:
+            self._init_directed(size, pipe_states, wfc_options)
+            return
+
         aux_states = (
             'U1', 'U0',
             'R1', 'R0',
@@ -63,52 +71,88 @@ class PipeGen:
 
         # [print(k,v) for k,v in adjacencyRules.items()]
 
-        self.wfc = WaveFunctionCollapse(states, adjacencyRules)
+        self.wfc = WaveFunctionCollapse(states, adjacencyRules, **wfc_options)
         self.size = size # (row, column)
 
-        for row in range(size[0]):
-            for col in range(size[1]):
-                name = "%d,%d" % (row, col)
-                self.wfc.addNode(name, pipe_states)
-                for dir in self.index_direction:
-                    self.wfc.addNode("$" + dir + name, (dir + "0", dir + "1"))
-                    self.wfc.addEdge("$" + dir + name, name)
-                if row > 0:
-                    up_neighbor = "%d,%d" % (row - 1, col)
-                    self.wfc.addEdge("$U" + name, "$D" + up_neighbor)
-                if col > 0:
-                    left_neighbor = "%d,%d" % (row, col - 1)
-                    self.wfc.addEdge("$L" + name, "$R" + left_neighbor)
+        names = ["%d,%d" % (row, col) for row in range(size[0]) for col in range(size[1])]
+        self.ids = self.wfc.add_nodes(names, pipe_states).reshape(size) # node id of every cell
+        # one auxiliary node per side of every cell, joined to its cell and to the facing side of the next cell
+        aux = {dir: self.wfc.add_nodes(("$" + dir + name for name in names), (dir + "0", dir + "1")).reshape(size)
+               for dir in self.index_direction}
+        for dir in self.index_direction:
+            self.wfc.add_edges(aux[dir], self.ids)
+        self.wfc.add_edges(aux['U'][1:, :], aux['D'][:-1, :])
+        self.wfc.add_edges(aux['L'][:, 1:], aux['R'][:, :-1])
         
         self.wfc.save_initial()
 
+    def _init_directed(self, size:tuple[int], pipe_states:'tuple[str]', wfc_options:dict):
+        labelRules = directed_rules(pipe_states)
+
+        self.wfc = WaveFunctionCollapse(list(pipe_states), dict(), labelAllow=labelRules, **wfc_options)
+        self.size = size # (row, column)
+
+        ids = self.wfc.add_nodes("%d,%d" % (row, col) for row in range(size[0]) for col in range(size[1])).reshape(size)
+        self.ids = ids
+        self.wfc.add_edges(ids[:-1, :], ids[1:, :], 'D')
+        self.wfc.add_edges(ids[:, :-1], ids[:, 1:], 'R')
+
+        self.wfc.save_initial()
+
     def generate(self):
         self.wfc.solve()
     
-    def show_img(self):
+    def as_mat(self):
+        # undecided cells index the trailing '?'
+        return np.array(self.wfc.states + ['?'])[self.wfc.result()[self.ids]]
+
+    def __str__(self):
+        return self.as_mat().__str__()
+
+    def image(self) -> np.ndarray:
+        # 3x3 pixels per cell on a checkered background, the tiles of the shaded cells come after the plain ones;
+        # the auxiliary states never end up in a cell and keep a blank tile
+        grid = self.wfc.result()[self.ids]
+        assert (grid >= 0).all()
         rows, cols = self.size
-        mat = np.full((rows * 3, cols * 3, 3), (255,255,255))
-        for row in range(rows):
-            for col in range(cols):
-                if row % 2 == col % 2:
-                    mat[row * 3: row * 3 + 3, col * 3: col * 3 + 3,:] = (213,223,249)
-                name = "%d,%d" % (row, col)
-                pipe_type = self.wfc.nodes[name].collapsed
-                assert pipe_type is not None
-                if pipe_type[0] == '1':
-                    mat[row * 3: row * 3 + 2, col * 3 + 1,:] = (0,0,0)
-                if pipe_type[2] == '1':
-                    mat[row * 3 + 1: row * 3 + 3, col * 3 + 1,:] = (0,0,0)
-                if pipe_type[1] == '1':
-                    mat[row * 3 + 1, col * 3 + 1: col * 3 + 3,:] = (0,0,0)
-                if pipe_type[3] == '1':
-                    mat[row * 3 + 1, col * 3: col * 3 + 2,:] = (0,0,0)
-                # if pipe_type == 'V' or pipe_type == 'C':
-                #     # draw a vertical line
-                #     mat[row * 3: row * 3 + 3, col * 3 + 1,:] = (0,0,0)
-
-        plt.imshow(mat)
-        plt.waitforbuttonpress()            
+        tiles = np.empty((2, len(self.wfc.states), 3, 3, 3), dtype=np.uint8)
+        tiles[0] = (255,255,255)
+        tiles[1] = (213,223,249)
+        for i, pipe_type in enumerate(self.wfc.states):
+            if len(pipe_type) != 4:
+                continue
+            if pipe_type[0] == '1':
+                tiles[:, i, 0:2, 1] = (0,0,0)
+            if pipe_type[2] == '1':
+                tiles[:, i, 1:3, 1] = (0,0,0)
+            if pipe_type[1] == '1':
+                tiles[:, i, 1, 1:3] = (0,0,0)
+            if pipe_type[3] == '1':
+                tiles[:, i, 1, 0:2] = (0,0,0)
+        shaded = np.add.outer(np.arange(rows), np.arange(cols)) % 2 == 0
+        return stamp(grid + shaded * len(self.wfc.states), tiles.reshape(-1, 3, 3, 3))
+
+    def show_img(self):
+        show_image(self.image())
+
+    def save_img(self, path:str):
+        # .png or .npy
+        save_image(path, self.image())
+
+def directed_rules(pipe_states:'tuple[str]') -> 'dict[str,dict[str,list[str]]]':
+    # 'R' rules hold for the right neighbor, 'D' rules for the one below, and the touching sides must agree
+    return {
+        'R': {p: [q for q in pipe_states if q[3] == p[1]] for p in pipe_states},
+        'D': {p: [q for q in pipe_states if q[0] == p[2]] for p in pipe_states},
+    }
+
+def stream_pipes(width:int, chunk_rows:int=16, alt=False, seed:'int|None'=None):
+    # endless pipe map of the given width, yielded as (chunk_rows, width) arrays of pipe states
+    pipe_states = PipeGen((1, 1), alt, directed=True, mode='bitset').wfc.states
+    rules = directed_rules(pipe_states)
+    states = np.array(pipe_states)
+    for chunk in stream_rows(width, chunk_rows, pipe_states, offsetAllow={(0, 1): rules['R'], (1, 0): rules['D']}, seed=seed):
+        yield states[chunk]
 
 if __name__ == "__main__":
     p = PipeGen((10,10), True)
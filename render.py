@@ -0,0 +1,24 @@
+import numpy as np
+import matplotlib.image
+
+# image output of the generators: every cell of a (H, W) grid of tile indices (state indices, possibly offset by a
+# background variant) is replaced by its (tile_h, tile_w, 3) RGB tile with one fancy index and a reshape
+
+def stamp(grid:np.ndarray, tiles:np.ndarray) -> np.ndarray:
+    # (H, W) tile indices and (N, tile_h, tile_w, 3) tiles -> (H * tile_h, W * tile_w, 3) image
+    rows, cols = grid.shape
+    _, tile_h, tile_w, channels = tiles.shape
+    return tiles[grid].transpose(0, 2, 1, 3, 4).reshape(rows * tile_h, cols * tile_w, channels)
+
+def save_image(path:str, image:np.ndarray):
+    # .npy keeps the raw array, anything else is written as an image file (PNG for .png)
+    if path.endswith('.npy'):
+        np.save(path, image)
+    else:
+        matplotlib.image.imsave(path, image)
+
+def show_image(image:np.ndarray):
+    import matplotlib.pyplot as plt
+    plt.imshow(image)
+    plt.tick_params(left=False, right=False, labelleft=False, labelbottom=False, bottom=False)
+    plt.show()
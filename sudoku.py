@@ -2,7 +2,9 @@ from cWFC import *
 import numpy as np
 
 class Sudoku:
-    def __init__(self, size):
+    def __init__(self, size, **wfc_options):
+        # bitset mode (the default here) states row, col and square uniqueness as all-different groups,
+        # classic mode as a clique of pairwise edges with an "everything but myself" rule table
         self.size = size
         assert np.sqrt(self.size) - int(np.sqrt(self.size)) < 0.0001
         states = [str(num + 1) for num in range(size)]
@@ -11,35 +13,26 @@ class Sudoku:
             adj_states = states.copy()
             adj_states.remove(state)
             adjacency_rules[state] = adj_states
-        self.wfc = WaveFunctionCollapse(states, adjacency_rules)
+        wfc_options.setdefault('mode', 'bitset')
+        self.wfc = WaveFunctionCollapse(states, adjacency_rules, **wfc_options)
         
-        for row in range(self.size):
-            for col in range(self.size):
-                name = "%d,%d" % (row, col)
-                self.wfc.addNode(name)
+        ids = self.wfc.add_nodes("%d,%d" % (row, col) for row in range(self.size) for col in range(self.size))
+        self.ids = ids.reshape(self.size, self.size) # node id of every cell
 
-        # connect cells with the other ones on its row and col
-        for row in range(self.size):
-            for col in range(self.size):
-                name = "%d,%d" % (row, col)
-                for r in range(self.size):
-                    if r != row:
-                        self.wfc.addEdge(name, "%d,%d" % (r, col))
-                for c in range(self.size):
-                    if c != col:
-                        self.wfc.addEdge(name, "%d,%d" % (row, c))
-
-        # group cells into squares
         square_size = int(np.sqrt(self.size))
-        for start_row in range(0, self.size, square_size):
-            for start_col in range(0, self.size, square_size):
-                for row in range(square_size):
-                    for col in range(square_size):
-                        name = "%d,%d" % (row + start_row, col + start_col)
-                        for r in range(square_size):
-                            for c in range(square_size):
-                                if r != row and c != col:
-                                    self.wfc.addEdge(name, "%d,%d" % (r + start_row, c + start_col))
+        rows, cols = np.divmod(ids, self.size)
+        squares = (rows // square_size) * square_size + cols // square_size
+        if self.wfc.mode == 'bitset':
+            grid = ids.reshape(self.size, self.size)
+            for i in range(self.size):
+                self.wfc.add_all_different(grid[i, :])
+                self.wfc.add_all_different(grid[:, i])
+                self.wfc.add_all_different(ids[squares == i])
+        else:
+            # every cell is connected to the other cells of its row, its col and its square
+            src, dst = np.triu_indices(len(ids), 1)
+            same_group = (rows[src] == rows[dst]) | (cols[src] == cols[dst]) | (squares[src] == squares[dst])
+            self.wfc.add_edges(ids[src[same_group]], ids[dst[same_group]])
 
         self.wfc.save_initial()
     
@@ -47,14 +40,8 @@ class Sudoku:
         self.wfc.solve()
 
     def as_mat(self):
-        mat = np.full((self.size, self.size), "?")
-        for name, node in self.wfc.nodes.items():
-            row, col = name.split(",")
-            row = int(row)
-            col = int(col)
-            if node.collapsed is not None:
-                mat[row,col] = node.collapsed
-        return mat
+        # undecided cells index the trailing '?', the dtype fits the longest state so "16" is not cut to "1"
+        return np.array(self.wfc.states + ['?'])[self.wfc.result()[self.ids]]
 
     def __str__(self):
         return self.as_mat().__str__()
@@ -0,0 +1,64 @@
+import os
+import sys
+import numpy as np
+
+# the modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cWFC import WaveFunctionCollapse
+
+# helpers shared by several test modules, imported with "from conftest import ..."
+
+def k4(**wfc_options):
+    # 3-coloring a K4, unsatisfiable but not caught by the initial propagation
+    states = ['a', 'b', 'c']
+    wfc = WaveFunctionCollapse(states, {x: [y for y in states if y != x] for x in states}, seed=1, **wfc_options)
+    for i in range(4):
+        wfc.addNode(str(i))
+    for i in range(4):
+        for j in range(i + 1, 4):
+            wfc.addEdge(str(i), str(j))
+    wfc.save_initial()
+    return wfc
+
+def sudoku4(givens:dict, **wfc_options):
+    # a 4x4 sudoku with some cells given, as all-different groups
+    states = ['1', '2', '3', '4']
+    wfc = WaveFunctionCollapse(states, {s: [t for t in states if t != s] for s in states}, mode='bitset', seed=0,
+                               **wfc_options)
+    for row in range(4):
+        for col in range(4):
+            wfc.addNode("%d,%d" % (row, col), givens.get((row, col)))
+    grid = np.arange(16).reshape(4, 4)
+    for i in range(4):
+        wfc.add_all_different(grid[i, :])
+        wfc.add_all_different(grid[:, i])
+        wfc.add_all_different(grid[i // 2 * 2:i // 2 * 2 + 2, i % 2 * 2:i % 2 * 2 + 2].ravel())
+    wfc.save_initial()
+    return wfc
+
+def valid(grid:np.ndarray) -> bool:
+    size = len(grid)
+    box = int(np.sqrt(size))
+    boxes = grid.reshape(box, box, box, box).transpose(0, 2, 1, 3).reshape(size, size)
+    return all(len(set(line)) == size for lines in (grid, grid.T, boxes) for line in lines)
+
+def three_colors(size:int, seed:int, kernel:str) -> WaveFunctionCollapse:
+    # 3-coloring a grid graph runs into contradictions now and then, so the restart path is covered too
+    states = ['a', 'b', 'c']
+    wfc = WaveFunctionCollapse(states, {s: [t for t in states if t != s] for s in states}, mode='bitset', seed=seed,
+                               kernel=kernel)
+    ids = wfc.add_nodes(size * size).reshape(size, size)
+    wfc.add_edges(ids[:, :-1].ravel(), ids[:, 1:].ravel())
+    wfc.add_edges(ids[:-1].ravel(), ids[1:].ravel())
+    wfc.save_initial()
+    return wfc
+
+def consistent(wfc, states:'np.ndarray|None'=None) -> bool:
+    # every arc of the solved graph (or of one of the solve_many() solutions) allows the state of its target given the
+    # state of its source
+    states = wfc.result() if states is None else states
+    sources = np.repeat(np.arange(wfc.num_nodes), np.diff(wfc.offsets))
+    kinds = 0 if wfc.arc_kinds is None else wfc.arc_kinds
+    masks = wfc.allow_masks[kinds, states[sources], states[wfc.indices] // 64]
+    return (states >= 0).all() and bool(((masks >> (states[wfc.indices] % 64).astype(np.uint64)) & 1).all())
@@ -0,0 +1,42 @@
+import asyncio
+import random
+from conftest import k4
+from pipe_wfc2 import PipeGen
+
+def test_async_matches_solve():
+    random.seed(1)
+    a = PipeGen((20, 20), mode='bitset', seed=4, backtrack_budget=20)
+    a.wfc.solve(100)
+    random.seed(1)
+    b = PipeGen((20, 20), mode='bitset', seed=4, backtrack_budget=20)
+    done = asyncio.run(b.wfc.solve_async(100, yield_every=7))
+    assert done['solved'] and not done['timed_out']
+    assert (done['result'] == a.wfc.result()).all()
+    assert done['restarts'] == a.wfc.restarts
+
+def test_timeout_drops_trail():
+    wfc = k4(mode='bitset', backtrack_budget=4, stats=True)
+    done = asyncio.run(wfc.solve_async(timeout=0.05, yield_every=1))
+    assert done['timed_out'] and not done['solved']
+    assert wfc.trail is None
+    assert wfc.stats['solved'] is False
+
+def test_cancel_drops_trail_and_finishes_stats():
+    wfc = k4(mode='bitset', backtrack_budget=4, stats=True)
+    finished = []
+    wfc.observe('solve', finished.append)
+
+    async def main():
+        task = asyncio.create_task(wfc.solve_async(yield_every=1))
+        for _ in range(20):
+            await asyncio.sleep(0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(main())
+    assert wfc.trail is None
+    assert len(finished) == 1 and 'solve_s' in wfc.stats
@@ -0,0 +1,46 @@
+import pytest
+from pipe_wfc2 import PipeGen
+from sudoku import Sudoku
+from conftest import valid
+from conftest import three_colors
+
+def state_of(wfc) -> tuple:
+    return wfc.domains.copy(), wfc.collapsed_state.copy(), wfc.uncertain_nodes.snapshot()
+
+@pytest.mark.parametrize('generator, size', [(Sudoku, 9), (PipeGen, (10, 10))])
+def test_undo_restores_everything(generator, size):
+    gen = generator(size, mode='bitset', seed=0, backtrack_budget=8)
+    wfc = gen.wfc
+    wfc.trail = []
+    before = state_of(wfc)
+    for _ in range(5):
+        node_id = wfc.uncertain_nodes.pop()
+        wfc.trail.append(('collapse', node_id, wfc.domains[node_id].copy()))
+        assert wfc._propagate_bitset(node_id, wfc._collapse_bitset(node_id))
+    assert (wfc.collapsed_state >= 0).sum() > (before[1] >= 0).sum()
+    wfc._undo(0)
+    after = state_of(wfc)
+    assert (after[0] == before[0]).all() and (after[1] == before[1]).all()
+    # every node is back in its bucket, the order within a bucket may differ
+    assert after[2][3] == before[2][3] and after[2][-1] == before[2][-1]
+
+def test_backtracking_replaces_restarts():
+    backtracks = 0
+    for seed in range(6):
+        gen = Sudoku(16, seed=seed, backtrack_budget=64)
+        assert gen.wfc.solve(0)
+        assert valid(gen.wfc.result()[gen.ids])
+        assert gen.wfc.trail is None
+        backtracks += gen.wfc.backtracks
+    assert backtracks > 0
+
+def test_exhausted_budget_restarts():
+    # one undo per attempt is not always enough, the attempt then starts over from the initial snapshot
+    restarts = 0
+    for seed in range(8):
+        wfc = three_colors(16, seed, 'python')
+        wfc.backtrack_budget = 1
+        assert wfc.solve(500)
+        assert (wfc.result() >= 0).all()
+        restarts += wfc.restarts
+    assert restarts > 0
@@ -0,0 +1,20 @@
+import pytest
+from benchmark import compare, main
+
+def results(solve_s:float) -> dict:
+    return {'cases': {'checker/8x8': {'build_s': 0.002, 'save_initial_s': 0.001, 'solve_s': solve_s}}}
+
+def test_compare_ignores_growth_below_the_noise_floor():
+    # doubling a 4ms phase is noise, doubling a 40ms one is not
+    assert compare(results(0.008), results(0.004), 0.25) == []
+    assert len(compare(results(0.08), results(0.04), 0.25)) == 1
+    assert compare(results(0.08), results(0.04), 0.25, noise_floor=0.1) == []
+
+@pytest.mark.parametrize('argv', [['--mode', 'classic', '--propagation', 'ac3'],
+                                  ['--mode', 'classic', '--kernel', 'numba'],
+                                  ['--repeats', '0']])
+def test_conflicting_options_are_usage_errors(argv, capsys):
+    with pytest.raises(SystemExit) as exit:
+        main(argv)
+    assert exit.value.code == 2
+    assert 'error:' in capsys.readouterr().err
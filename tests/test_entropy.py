@@ -0,0 +1,40 @@
+import pytest
+from cWFC import EntropyHeap, IndexSort, WaveFunctionCollapse
+from pipe_wfc2 import PipeGen
+from sudoku import Sudoku
+from conftest import consistent, valid
+
+def test_heuristic_picks_the_queue():
+    assert type(PipeGen((3, 3), directed=True, heuristic='entropy').wfc.uncertain_nodes) == EntropyHeap
+    assert type(PipeGen((3, 3), directed=True).wfc.uncertain_nodes) == IndexSort
+
+@pytest.mark.parametrize('seed', range(3))
+def test_entropy_solves_follow_the_rules(seed):
+    gen = PipeGen((12, 12), directed=True, heuristic='entropy', seed=seed, backtrack_budget=20,
+                  weights={'0000': 4, '1111': 0.5})
+    assert gen.wfc.solve(100)
+    assert consistent(gen.wfc)
+
+def test_entropy_sudoku_is_valid():
+    gen = Sudoku(9, seed=0, heuristic='entropy', backtrack_budget=16)
+    assert gen.wfc.solve(50)
+    assert valid(gen.wfc.result()[gen.ids])
+
+def test_lowest_entropy_goes_first():
+    # two states each, but 1:9 weights leave far less to chance than 1:1
+    wfc = WaveFunctionCollapse(['a', 'b', 'c', 'd'], {s: ['a', 'b', 'c', 'd'] for s in 'abcd'}, mode='bitset',
+                               heuristic='entropy', weights={'c': 1, 'd': 9}, seed=0)
+    wfc.addNode('even', ('a', 'b'))
+    wfc.addNode('skewed', ('c', 'd'))
+    wfc.addNode('all')
+    wfc.save_initial()
+    assert [wfc.uncertain_nodes.pop() for _ in range(3)] == [1, 0, 2]
+
+def test_entropy_heap_updates_and_removes():
+    heap = EntropyHeap(0.5)
+    for node_id, key in enumerate([3.0, 1.0, 2.0, 0.5]):
+        heap.add(node_id, key)
+    heap.update(0, 0.1)
+    heap.remove(3)
+    assert [heap.pop() for _ in range(3)] == [0, 1, 2]
+    assert heap.empty()
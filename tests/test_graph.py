@@ -0,0 +1,78 @@
+import random
+import pytest
+from cWFC import KERNEL_MODE, IndexSort, WaveFunctionCollapse
+from checkerboard_wfc import CheckerGen
+from pipe_wfc2 import PipeGen
+from conftest import consistent
+
+def checker_rules():
+    return ['B', 'W'], {'B': ['W'], 'W': ['B']}
+
+def test_add_nodes_rejects_duplicates_without_changes():
+    wfc = WaveFunctionCollapse(*checker_rules(), mode='bitset')
+    wfc.add_nodes(['x', 'y'])
+    for names in (['z', 'x'], ['q', 'q']):
+        with pytest.raises(ValueError):
+            wfc.add_nodes(names)
+        assert wfc.node_index == {'x': 0, 'y': 1}
+        assert wfc.num_nodes == 2
+    assert wfc.add_nodes(['z']).tolist() == [2]
+
+@pytest.mark.parametrize('mode', ['classic', 'bitset'])
+def test_checkerboard_alternates(mode):
+    gen = CheckerGen((8, 9), mode=mode, seed=0)
+    gen.generate()
+    grid = gen.wfc.result()[gen.ids]
+    assert (grid >= 0).all()
+    assert (grid[1:, :] != grid[:-1, :]).all()
+    assert (grid[:, 1:] != grid[:, :-1]).all()
+
+@pytest.mark.parametrize('options', [{'propagation': 'ac3'}, {'backtrack_budget': 4}, {'heuristic': 'entropy'}])
+def test_batched_solve_many_rejects_unsupported_options(options):
+    gen = CheckerGen((4, 4), mode='bitset', seed=0, **options)
+    with pytest.raises(ValueError):
+        gen.wfc.solve_many(2, batched=True)
+    assert gen.wfc.solve_many(2, seeds=[0, 1]).shape == (2, 16)
+
+def test_batched_solve_many_solves():
+    gen = CheckerGen((6, 6), mode='bitset', seed=0)
+    solutions = gen.wfc.solve_many(5, batched=True)
+    grids = solutions[:, gen.ids]
+    assert (grids[:, 1:, :] != grids[:, :-1, :]).all()
+    assert (grids[:, :, 1:] != grids[:, :, :-1]).all()
+
+@pytest.mark.parametrize('directed', [False, True])
+def test_batched_solve_many_follows_the_rules(directed):
+    wfc = PipeGen((8, 8), directed=directed, mode='bitset', seed=0).wfc
+    solutions = wfc.solve_many(6, seeds=range(6), batched=True)
+    assert all(consistent(wfc, states) for states in solutions)
+    assert len({states.tobytes() for states in solutions}) > 1
+
+def test_solve_many_solves_one_after_the_other_by_default():
+    wfc = CheckerGen((5, 5), mode='bitset', seed=0).wfc
+    solutions = wfc.solve_many(3, seeds=[4, 5, 6])
+    for seed, states in zip([4, 5, 6], solutions):
+        wfc.rng = random.Random(seed)
+        wfc.load_initial()
+        assert wfc.solve()
+        assert (wfc.result() == states).all()
+
+def test_compile_queues_nodes_as_added():
+    # compile() queues every added node at once, in the order adding them one by one would have
+    wfc = WaveFunctionCollapse(['a', 'b', 'c'], {'a': ['b', 'c'], 'b': ['c'], 'c': []}, mode='bitset')
+    wfc.add_nodes(3)
+    wfc.addNode('x', ('a', 'b'))
+    wfc.addNode('y', 'c')
+    wfc.add_nodes(['z', 'w'], ('b', 'c'))
+    wfc.addNode('v', priority_modifier=-1)
+    wfc.compile()
+    expected = IndexSort(3)
+    for node_id, count in [(2, 3), (1, 3), (0, 3), (3, 2), (6, 2), (5, 2), (7, 2)]:
+        expected.add(node_id, count)
+    expected.trim(8)
+    assert wfc.uncertain_nodes.snapshot() == expected.snapshot()
+
+def test_generators_default_to_the_kernel_mode():
+    assert CheckerGen((2, 2)).wfc.mode == KERNEL_MODE
+    assert PipeGen((2, 2)).wfc.mode == KERNEL_MODE
+    assert PipeGen((2, 2), directed=True).wfc.mode == 'bitset'
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import wfc_kernel
+from gridWFC import GridWFC, stream_rows
+from pipe_wfc2 import PipeGen, directed_rules
+
+def different(states:'list[str]') -> 'dict[str,list[str]]':
+    return {s: [t for t in states if t != s] for s in states}
+
+def pipe_grid(shape:'tuple[int,int]', seed:int) -> GridWFC:
+    states = PipeGen((1, 1), directed=True, mode='bitset').wfc.states
+    rules = directed_rules(states)
+    return GridWFC(shape, states, offsetAllow={(0, 1): rules['R'], (1, 0): rules['D']}, seed=seed)
+
+def fits(grid:GridWFC, result:np.ndarray) -> bool:
+    # every stencil neighbor of every cell is allowed by the rule of its offset
+    height, width = result.shape
+    for (dy, dx), rule in grid.offsets.items():
+        rows = slice(max(-dy, 0), height - max(dy, 0))
+        cols = slice(max(-dx, 0), width - max(dx, 0))
+        shifted = result[max(dy, 0):height + min(dy, 0), max(dx, 0):width + min(dx, 0)]
+        if not (rule[result[rows, cols], shifted] > 0).all():
+            return False
+    return (result >= 0).all()
+
+def test_checkerboard():
+    grid = GridWFC((60, 80), ['B', 'W'], {'B': ['W'], 'W': ['B']}, seed=0)
+    result = grid.solve()
+    assert (result[:, 1:] != result[:, :-1]).all() and (result[1:] != result[:-1]).all()
+
+@pytest.mark.parametrize('seed', range(3))
+def test_pipes_fit(seed):
+    grid = pipe_grid((40, 30), seed)
+    assert fits(grid, grid.solve())
+
+def test_moore_coloring():
+    states = ['a', 'b', 'c', 'd']
+    grid = GridWFC((25, 25), states, different(states), stencil='moore', seed=1, max_restarts=50)
+    assert fits(grid, grid.solve())
+
+def test_sudoku_groups():
+    states = [str(i + 1) for i in range(9)]
+    grid = GridWFC((9, 9), states, different(states), stencil='sudoku', seed=0, max_restarts=500)
+    result = grid.solve()
+    boxes = result.reshape(3, 3, 3, 3).transpose(0, 2, 1, 3).reshape(9, 9)
+    assert all(len(set(line)) == 9 for lines in (result, result.T, boxes) for line in lines)
+
+def test_assign_is_kept():
+    grid = GridWFC((10, 10), ['B', 'W'], {'B': ['W'], 'W': ['B']}, seed=0)
+    grid.assign(3, 4, 'B')
+    result = grid.solve()
+    assert result[3, 4] == 0 and (result[:, 1:] != result[:, :-1]).all()
+
+def test_contradicting_assigns_raise():
+    grid = GridWFC((4, 4), ['B', 'W'], {'B': ['W'], 'W': ['B']}, seed=0)
+    grid.assign(0, 0, 'B')
+    grid.assign(0, 1, 'B')
+    with pytest.raises(RuntimeError):
+        grid.solve()
+
+def test_restarts_start_over():
+    # 3-coloring a grid needs restarts, each one goes back to the initial wave and queue
+    states = ['a', 'b', 'c']
+    grid = GridWFC((12, 12), states, different(states), seed=9)
+    assert fits(grid, grid.solve())
+    assert grid.restarts > 0
+    grid = GridWFC((12, 12), states, different(states), seed=0, max_restarts=0)
+    with pytest.raises(RuntimeError):
+        grid.solve()
+
+def stream(grid_shape:'tuple[int,int]', chunks:int, **options) -> np.ndarray:
+    # the first chunks of stream_rows() stacked into one grid
+    rows, width = grid_shape
+    return np.concatenate([chunk for chunk, _ in zip(stream_rows(width, rows, **options), range(chunks))])
+
+def test_stream_chunks_fit_together():
+    states = PipeGen((1, 1), directed=True, mode='bitset').wfc.states
+    rules = directed_rules(states)
+    options = dict(states=states, offsetAllow={(0, 1): rules['R'], (1, 0): rules['D']}, seed=3)
+    result = stream((8, 40), 4, **options)
+    assert result.shape == (32, 40)
+    assert fits(pipe_grid((1, 1), 0), result)
+    assert (stream((8, 40), 4, **options) == result).all()
+
+def test_stream_moore():
+    states = ['a', 'b', 'c', 'd']
+    result = stream((5, 20), 4, states=states, adjacencyAllow=different(states), stencil='moore', seed=0)
+    grid = GridWFC((1, 1), states, different(states), stencil='moore')
+    assert fits(grid, result)
+
+@pytest.mark.skipif(wfc_kernel.numba is None, reason="numba is not installed")
+def test_stream_kernels_match():
+    states = ['B', 'W', 'G']
+    options = dict(states=states, adjacencyAllow={'B': ['W', 'G'], 'W': ['B'], 'G': ['B', 'G']}, seed=5)
+    assert (stream((6, 30), 3, kernel='python', **options) == stream((6, 30), 3, kernel='numba', **options)).all()
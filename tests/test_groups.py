@@ -0,0 +1,28 @@
+import pytest
+from conftest import sudoku4, valid
+from sudoku import Sudoku
+
+@pytest.mark.parametrize('size', [4, 9, 16])
+def test_sudoku_groups_solve(size):
+    gen = Sudoku(size, seed=1)
+    assert gen.wfc.solve()
+    assert valid(gen.wfc.result()[gen.ids])
+
+def test_givens_are_kept():
+    wfc = sudoku4({(0, 0): '1', (1, 2): '1', (3, 3): '2'})
+    assert not wfc.infeasible
+    assert wfc.solve()
+    grid = wfc.result().reshape(4, 4)
+    assert valid(grid)
+    assert grid[0, 0] == 0 and grid[1, 2] == 0 and grid[3, 3] == 1
+
+@pytest.mark.parametrize('propagation', ['neighbor', 'ac3'])
+def test_duplicate_givens_are_infeasible(propagation):
+    wfc = sudoku4({(0, 0): '1', (0, 3): '1'}, propagation=propagation)
+    assert wfc.infeasible
+    assert not wfc.solve()
+
+def test_hidden_single_is_forced():
+    # '1' is banned from three cells of row 0, so the fourth one takes it before any collapse
+    wfc = sudoku4({(1, 0): '1', (2, 1): '1', (3, 2): '1'})
+    assert wfc.possible()[3].tolist() == [True, False, False, False]
@@ -0,0 +1,34 @@
+import pytest
+import wfc_kernel
+from cWFC import WaveFunctionCollapse
+from checkerboard_wfc import CheckerGen
+from octboard_wfc import OctCheckerGen
+from pipe_wfc2 import PipeGen
+from conftest import k4, three_colors
+
+pytestmark = pytest.mark.skipif(wfc_kernel.numba is None, reason="numba is not installed")
+
+def solved(wfc:WaveFunctionCollapse, max_restarts:'int|None'=None) -> tuple:
+    return wfc.solve(max_restarts), wfc.restarts, wfc.result().tolist(), wfc.rng.random()
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('generator, size', [(CheckerGen, (20, 20)), (OctCheckerGen, (15, 15)), (PipeGen, (15, 15))])
+def test_generators_match(generator, size, seed):
+    python = generator(size, mode='bitset', seed=seed, kernel='python')
+    numba = generator(size, mode='bitset', seed=seed, kernel='numba')
+    assert solved(python.wfc) == solved(numba.wfc)
+
+def test_restarts_match():
+    restarts = 0
+    for seed in range(8):
+        python, numba = three_colors(16, seed, 'python'), three_colors(16, seed, 'numba')
+        expected = solved(python, 500)
+        assert solved(numba, 500) == expected
+        restarts += expected[1]
+    assert restarts > 0
+
+def test_out_of_restarts_matches():
+    python, numba = k4(mode='bitset', kernel='python'), k4(mode='bitset', kernel='numba')
+    expected = solved(python, 20)
+    assert expected[:2] == (False, 20)
+    assert solved(numba, 20) == expected
@@ -0,0 +1,55 @@
+import pytest
+import wfc_kernel
+from cWFC import WaveFunctionCollapse
+from pipe_wfc2 import PipeGen
+from conftest import consistent
+
+KERNELS = ['python', pytest.param('numba', marks=pytest.mark.skipif(wfc_kernel.numba is None,
+                                                                      reason="numba is not installed"))]
+
+# two cyclic rules whose only common ground is "same state": each alone lets a neighbor differ
+CYCLES = {'x': {'A': ['A', 'C'], 'B': ['B', 'A'], 'C': ['C', 'B']},
+          'y': {'A': ['A', 'B'], 'B': ['B', 'C'], 'C': ['C', 'A']}}
+
+def parallel_grid(seed:int, kernel:str, unlabelled:bool=False) -> WaveFunctionCollapse:
+    # every pair of grid neighbors is joined by an 'x' and a 'y' edge, or by an 'x' and an unlabelled one
+    adjacency = CYCLES['y'] if unlabelled else {}
+    wfc = WaveFunctionCollapse(['A', 'B', 'C'], adjacency, mode='bitset', labelAllow=CYCLES, seed=seed, kernel=kernel)
+    ids = wfc.add_nodes(64).reshape(8, 8)
+    for label in ('x', None if unlabelled else 'y'):
+        wfc.add_edges(ids[:, :-1].ravel(), ids[:, 1:].ravel(), label)
+        wfc.add_edges(ids[:-1].ravel(), ids[1:].ravel(), label)
+    wfc.save_initial()
+    return wfc
+
+@pytest.mark.parametrize('kernel', KERNELS)
+@pytest.mark.parametrize('seed', range(5))
+def test_parallel_labels_all_hold(kernel, seed):
+    wfc = parallel_grid(seed, kernel)
+    assert wfc.parallel_arcs
+    assert wfc.solve()
+    assert consistent(wfc)
+    assert len(set(wfc.result().tolist())) == 1
+
+@pytest.mark.parametrize('kernel', KERNELS)
+def test_labelled_and_unlabelled_edge_both_hold(kernel):
+    # an unlabelled edge checks the rule both ways, so 'x' plus the symmetric closure of 'y' leaves only "same"
+    for seed in range(5):
+        wfc = parallel_grid(seed, kernel, unlabelled=True)
+        assert wfc.solve()
+        assert consistent(wfc)
+
+def test_batched_solve_many_keeps_parallel_labels():
+    wfc = parallel_grid(0, 'python')
+    solutions = wfc.solve_many(4, batched=True)
+    assert all(consistent(wfc, states) for states in solutions)
+
+def test_single_arcs_are_not_parallel():
+    assert not PipeGen((4, 4), directed=True, mode='bitset').wfc.parallel_arcs
+
+@pytest.mark.parametrize('kernel', KERNELS)
+@pytest.mark.parametrize('seed', range(3))
+def test_directed_pipes_fit(kernel, seed):
+    gen = PipeGen((12, 12), directed=True, mode='bitset', seed=seed, kernel=kernel, backtrack_budget=20)
+    assert gen.wfc.solve(100)
+    assert consistent(gen.wfc)
@@ -0,0 +1,14 @@
+import pytest
+import wfc_kernel
+from benchmark import BYTES_PER_NODE_TARGET, bytes_per_node
+from checkerboard_wfc import CheckerGen
+
+@pytest.mark.parametrize('kernel', ['python', pytest.param('numba', marks=pytest.mark.skipif(
+    wfc_kernel.numba is None, reason="numba is not installed"))])
+def test_bytes_per_node_within_target(kernel):
+    assert bytes_per_node((200, 200), kernel=kernel) <= BYTES_PER_NODE_TARGET
+
+def test_classic_nodes_have_slots():
+    gen = CheckerGen((3, 3), mode='classic', seed=0)
+    node = next(iter(gen.wfc.nodes.values()))
+    assert not hasattr(node, '__dict__')
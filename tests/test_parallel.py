@@ -0,0 +1,52 @@
+import random
+import numpy as np
+import pytest
+from cWFC import WaveFunctionCollapse
+from conftest import consistent, k4, three_colors
+
+def test_solve_parallel_gives_up_on_infeasible_problems():
+    wfc = WaveFunctionCollapse(['B', 'W'], {'B': ['W'], 'W': ['B']}, mode='bitset', kernel='python')
+    wfc.addNode('x', 'B')
+    wfc.addNode('y', 'B')
+    wfc.addEdge('x', 'y')
+    wfc.save_initial()
+    assert wfc.infeasible
+    assert not wfc.solve_parallel(workers=2)
+
+def test_solve_parallel_stops_after_max_attempts():
+    # unsatisfiable, but only a solve finds out
+    wfc = k4(mode='bitset', kernel='python')
+    assert not wfc.infeasible
+    assert not wfc.solve_parallel(workers=2)
+    assert not wfc.solve_parallel(workers=2, max_attempts=3)
+
+def first_success(wfc:WaveFunctionCollapse, seed:int) -> np.ndarray:
+    # what solve_parallel() promises: the lowest numbered attempt that solves without restarts
+    for attempt in range(64):
+        wfc.rng = random.Random("%d:%d" % (seed, attempt))
+        wfc.load_initial()
+        if wfc.solve(0):
+            return wfc.result()
+
+@pytest.mark.parametrize('seed', [0, 3]) # the first attempts of both run into a contradiction
+def test_solve_parallel_does_not_depend_on_workers(seed):
+    results = []
+    for workers in (1, 3):
+        wfc = three_colors(12, 0, 'python')
+        assert wfc.solve_parallel(workers=workers, seed=seed)
+        assert consistent(wfc)
+        assert wfc.uncertain_nodes.empty()
+        results.append(wfc.result())
+    assert (results[0] == results[1]).all()
+    assert (results[0] == first_success(three_colors(12, 0, 'python'), seed)).all()
+
+def test_solve_many_parallel_does_not_depend_on_workers(tmp_path):
+    wfc = three_colors(6, 0, 'python')
+    expected = wfc.solve_many(7, seeds=["5:%d" % i for i in range(7)])
+    assert all(consistent(wfc, states) for states in expected)
+    for workers in (1, 2, 4):
+        assert (wfc.solve_many_parallel(7, workers=workers, seed=5) == expected).all()
+    # workers map a problem file instead of unpickling the solver
+    wfc.save_problem(str(tmp_path / "grid.wfc"))
+    loaded = WaveFunctionCollapse.load_problem(str(tmp_path / "grid.wfc"))
+    assert (loaded.solve_many_parallel(7, workers=2, seed=5) == expected).all()
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import wfc_kernel
+from cWFC import WaveFunctionCollapse
+from pipe_wfc2 import PipeGen
+from sudoku import Sudoku
+from conftest import sudoku4
+
+@pytest.mark.parametrize('kernel', ['python', pytest.param('numba', marks=pytest.mark.skipif(
+    wfc_kernel.numba is None, reason="numba is not installed"))])
+def test_roundtrip_solves_the_same(tmp_path, kernel):
+    path = str(tmp_path / 'pipes.wfc')
+    gen = PipeGen((12, 12), mode='bitset', seed=3, kernel=kernel)
+    gen.wfc.save_problem(path)
+    gen.wfc.solve()
+    loaded = WaveFunctionCollapse.load_problem(path, seed=3)
+    assert loaded.kernel == kernel
+    assert loaded.node_names == gen.wfc.node_names
+    assert loaded.solve()
+    assert (loaded.result() == gen.wfc.result()).all()
+    assert loaded.restarts == gen.wfc.restarts
+
+def test_roundtrip_keeps_options_and_groups(tmp_path):
+    path = str(tmp_path / 'sudoku.wfc')
+    gen = Sudoku(9, seed=2, backtrack_budget=16, prune=False, propagation='ac3')
+    gen.wfc.save_problem(path)
+    loaded = WaveFunctionCollapse.load_problem(path, seed=2)
+    assert (loaded.propagation, loaded.backtrack_budget, loaded.prune) == ('ac3', 16, False)
+    assert loaded.group_offsets is not None
+    assert loaded.solve()
+    grid = loaded.result()[gen.ids]
+    assert all(len(set(line)) == 9 for line in np.concatenate([grid, grid.T]))
+
+def test_roundtrip_keeps_infeasible(tmp_path):
+    path = str(tmp_path / 'bad.wfc')
+    wfc = sudoku4({(0, 0): '1', (0, 3): '1'})
+    wfc.save_problem(path)
+    loaded = WaveFunctionCollapse.load_problem(path)
+    assert loaded.infeasible
+    assert not loaded.solve()
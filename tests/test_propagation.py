@@ -0,0 +1,24 @@
+import numpy as np
+from cWFC import WaveFunctionCollapse, restarts_avoided
+
+def sudoku_edges(propagation:str) -> WaveFunctionCollapse:
+    # a 9x9 sudoku as pairwise "not equal" edges instead of all-different groups: pruning neighbors alone runs
+    # into contradictions that arc consistency sees coming
+    states = [str(i) for i in range(9)]
+    wfc = WaveFunctionCollapse(states, {s: [t for t in states if t != s] for s in states}, mode='bitset',
+                               propagation=propagation)
+    ids = wfc.add_nodes(81).reshape(9, 9)
+    for i in range(9):
+        for unit in (ids[i, :], ids[:, i], ids[i // 3 * 3:i // 3 * 3 + 3, i % 3 * 3:i % 3 * 3 + 3].ravel()):
+            first, second = np.triu_indices(9, 1)
+            wfc.add_edges(unit[first], unit[second])
+    wfc.save_initial()
+    return wfc
+
+def test_restarts_avoided_by_ac3():
+    report = restarts_avoided(sudoku_edges, trials=10)
+    assert set(report) == {'neighbor', 'ac3', 'avoided'}
+    assert report['avoided'] == report['neighbor'] - report['ac3']
+    assert report['neighbor'] > report['ac3'] >= 0
+    # every trial reseeds the global random module, so the report repeats
+    assert restarts_avoided(sudoku_edges, trials=10) == report
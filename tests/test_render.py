@@ -0,0 +1,59 @@
+import matplotlib.image
+import numpy as np
+import pytest
+from render import stamp, save_image
+from checkerboard_wfc import CheckerGen
+from octboard_wfc import OctCheckerGen
+from pipe_wfc2 import PipeGen
+
+def test_stamp_places_every_tile():
+    tiles = np.arange(2 * 2 * 3 * 3, dtype=np.uint8).reshape(2, 2, 3, 3)
+    grid = np.array([[0, 1, 1], [1, 0, 0]])
+    image = stamp(grid, tiles)
+    assert image.shape == (4, 9, 3)
+    for row in range(2):
+        for col in range(3):
+            assert (image[2 * row:2 * row + 2, 3 * col:3 * col + 3] == tiles[grid[row, col]]).all()
+
+def test_save_image_round_trips(tmp_path):
+    image = stamp(np.array([[0, 1], [1, 0]]), np.array([[[[0, 0, 0]]], [[[255, 255, 255]]]], dtype=np.uint8))
+    save_image(str(tmp_path / "board.npy"), image)
+    assert (np.load(tmp_path / "board.npy") == image).all()
+    save_image(str(tmp_path / "board.png"), image)
+    png = matplotlib.image.imread(str(tmp_path / "board.png"))
+    assert png.shape[:2] == (2, 2)
+    assert (np.round(png[..., :3] * 255) == image).all()
+
+def test_checkerboard_pixels():
+    gen = CheckerGen((2, 3), mode='bitset', seed=0)
+    assert (gen.as_mat() == '?').all()
+    gen.generate()
+    board = gen.as_mat()
+    assert set(board.ravel()) == {'B', 'W'}
+    image = gen.image()
+    assert image.shape == (2, 3, 3) and image.dtype == np.uint8
+    assert ((image == 0).all(axis=2) == (board == 'B')).all()
+    assert ((image == 255).all(axis=2) == (board == 'W')).all()
+
+def test_octboard_pixels():
+    gen = OctCheckerGen((3, 3), mode='bitset', seed=0)
+    gen.generate()
+    image = gen.image()
+    assert image.shape == (3, 3, 3)
+    assert (image[gen.as_mat() == 'A'] == (50, 60, 70)).all()
+
+@pytest.mark.parametrize('directed', [False, True])
+def test_pipe_pixels(directed):
+    gen = PipeGen((2, 3), directed=directed, mode='bitset', seed=1)
+    gen.generate()
+    pipes = gen.as_mat()
+    image = gen.image()
+    assert image.shape == (6, 9, 3)
+    cells = image.reshape(2, 3, 3, 3, 3).transpose(0, 2, 1, 3, 4)
+    for row in range(2):
+        for col in range(3):
+            cell, pipe = cells[row, col], pipes[row, col]
+            # the corners show the checkered background, the middle of each side is black where the pipe leaves
+            assert (cell[0, 0] == ((213, 223, 249) if (row + col) % 2 == 0 else (255, 255, 255))).all()
+            sides = [cell[0, 1], cell[1, 2], cell[2, 1], cell[1, 0]] # up, right, down, left
+            assert [bool((side == 0).all()) for side in sides] == [bit == '1' for bit in pipe]
@@ -0,0 +1,67 @@
+import pytest
+from checkerboard_wfc import CheckerGen
+from pipe_wfc2 import PipeGen
+from conftest import consistent
+
+def test_pin_keeps_the_rest():
+    gen = PipeGen((20, 20), mode='bitset', seed=2)
+    wfc = gen.wfc
+    assert wfc.solve()
+    before = wfc.result()
+    name = wfc.node_names[gen.ids[10, 10]]
+    state = next(s for s in wfc.states if wfc.state_index[s] != before[gen.ids[10, 10]])
+    wfc.pin(name, state)
+    assert wfc.resolve(radius=2)
+    after = wfc.result()
+    assert after[gen.ids[10, 10]] == wfc.state_index[state]
+    assert consistent(wfc)
+    # the corners are far outside the region
+    corners = gen.ids[[0, 0, -1, -1], [0, -1, 0, -1]]
+    assert (after[corners] == before[corners]).all()
+
+def test_pin_grows_to_the_whole_graph():
+    # a checkerboard has two solutions, flipping one cell flips every other one
+    gen = CheckerGen((8, 8), mode='bitset', seed=0)
+    wfc = gen.wfc
+    assert wfc.solve()
+    before = wfc.result()
+    state = wfc.states[1 - before[0]]
+    wfc.pin(wfc.node_names[0], state)
+    assert wfc.resolve(radius=1)
+    assert (wfc.result() == 1 - before).all()
+
+@pytest.mark.parametrize('radius', [0, 1])
+def test_conflicting_pin_widens_the_region(radius):
+    # the pinned cell alone clashes with its collapsed neighbors, resolve() has to reopen them too
+    gen = CheckerGen((6, 6), mode='bitset', seed=0)
+    wfc = gen.wfc
+    assert wfc.solve()
+    before = wfc.result()
+    wfc.pin('2,3', wfc.states[1 - before[gen.ids[2, 3]]])
+    assert wfc.resolve(radius=radius)
+    assert wfc.result()[gen.ids[2, 3]] == 1 - before[gen.ids[2, 3]]
+    assert consistent(wfc)
+
+def test_unpin_frees_the_node():
+    gen = CheckerGen((6, 6), mode='bitset', seed=1)
+    wfc = gen.wfc
+    wfc.solve()
+    wfc.pin('0,0', 'B')
+    assert wfc.resolve()
+    wfc.unpin('0,0')
+    wfc.release(['2,2'])
+    assert wfc.resolve()
+    assert not wfc.pins and not wfc.released
+    assert consistent(wfc)
+
+def test_impossible_pins_fail():
+    gen = CheckerGen((4, 4), mode='bitset', seed=0)
+    gen.wfc.solve()
+    gen.wfc.pin('0,0', 'B')
+    gen.wfc.pin('0,1', 'B')
+    assert not gen.wfc.resolve()
+
+def test_classic_mode_rejects_pins():
+    gen = CheckerGen((4, 4), mode='classic', seed=0)
+    with pytest.raises(ValueError):
+        gen.wfc.pin('0,0', 'B')
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from cWFC import WaveFunctionCollapse, compile_rules, popcount
+
+def checker(**wfc_options) -> WaveFunctionCollapse:
+    return WaveFunctionCollapse(['B', 'W'], {'B': ['W'], 'W': ['B']}, mode='bitset', seed=0, **wfc_options)
+
+@pytest.mark.parametrize('options', [{}, {'prune': False}, {'propagation': 'ac3'},
+                                     {'prune': False, 'propagation': 'ac3'}])
+def test_adjacent_givens_that_clash_are_infeasible(options):
+    wfc = checker(**options)
+    wfc.addNode('x', 'B')
+    wfc.addNode('y', 'B')
+    wfc.addNode('z')
+    wfc.addEdge('x', 'y')
+    wfc.addEdge('y', 'z')
+    wfc.save_initial()
+    assert wfc.infeasible
+    assert not wfc.solve()
+
+def test_labelled_givens_are_checked_in_their_direction():
+    # 'R' lets B have W on its right, W on the left of B is fine but not the other way round
+    def solver(left:str, right:str) -> WaveFunctionCollapse:
+        wfc = WaveFunctionCollapse(['B', 'W'], dict(), mode='bitset', labelAllow={'R': {'B': ['W'], 'W': ['W']}})
+        wfc.addNode('a', left)
+        wfc.addNode('b', right)
+        wfc.addEdge('a', 'b', 'R')
+        wfc.save_initial()
+        return wfc
+    assert not solver('B', 'W').infeasible
+    assert solver('W', 'B').infeasible
+
+def test_rule_cache_shares_read_only_tables():
+    a = checker()
+    b = WaveFunctionCollapse(['B', 'W'], {'W': ['B'], 'B': ['W']}, mode='bitset')
+    assert a.rules is b.rules
+    assert compile_rules(['B', 'W'], {'B': ['W', 'B'], 'W': ['B']}, dict()) is not a.rules
+    with pytest.raises(ValueError):
+        a.allow_masks[0, 0, 0] = 0
+
+# a and b go with c and only c, nothing goes with d
+ISLAND = (['a', 'b', 'c', 'd'], {'a': ['c'], 'b': ['c'], 'c': ['a', 'b'], 'd': []})
+
+def test_state_analysis():
+    rules = compile_rules(*ISLAND, dict())
+    assert rules['unsupported'][0].tolist() == [False, False, False, True]
+    assert rules['equivalent'] == [['a', 'b']]
+    assert rules['symmetric'] == [('a', 'b')]
+    # B and W are not interchangeable on their own, but swapping both everywhere keeps every solution one
+    rules = checker().rules
+    assert rules['equivalent'] == []
+    assert rules['symmetric'] == [('B', 'W')]
+
+@pytest.mark.parametrize('prune', [True, False])
+def test_prune_reaches_the_whole_graph(prune):
+    # a given at one end of a path decides every node with prune, only its neighbor without
+    wfc = checker(prune=prune)
+    ids = wfc.add_nodes(6)
+    wfc.addNode('given', 'B')
+    wfc.add_edges(ids[:-1], ids[1:])
+    wfc.add_edges([6], [0])
+    wfc.save_initial()
+    counts = popcount(wfc.domains[ids]).tolist()
+    assert counts == ([1] * 6 if prune else [1] + [2] * 5)
+
+def test_prune_removes_unsupported_states():
+    wfc = WaveFunctionCollapse(*ISLAND, mode='bitset', seed=0)
+    ids = wfc.add_nodes(4)
+    wfc.add_edges(ids[:-1], ids[1:])
+    wfc.save_initial()
+    d = wfc.state_index['d']
+    assert not ((wfc.domains[ids, 0] >> np.uint64(d)) & np.uint64(1)).any()
+    assert wfc.solve()
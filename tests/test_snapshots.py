@@ -0,0 +1,38 @@
+import random
+import pytest
+from checkerboard_wfc import CheckerGen
+from octboard_wfc import OctCheckerGen
+
+@pytest.mark.parametrize('mode', ['classic', 'bitset'])
+def test_named_snapshot_restores_a_partial_solve(mode):
+    random.seed(0)
+    wfc = OctCheckerGen((6, 6), mode=mode, seed=0).wfc
+    for _ in range(5):
+        assert wfc.propagate()
+    middle = wfc.result()
+    wfc.save_snapshot('middle')
+    assert wfc.solve()
+    solved = wfc.result()
+    assert (solved >= 0).all()
+
+    wfc.load_snapshot('middle')
+    assert (wfc.result() == middle).all()
+    # the queue came back too, so the rest of the solve works again, keeping the five collapses
+    assert wfc.solve()
+    assert (wfc.result()[middle >= 0] == middle[middle >= 0]).all()
+
+    wfc.load_snapshot('initial')
+    assert (wfc.result() < 0).all()
+    wfc.drop_snapshot('middle')
+    with pytest.raises(KeyError):
+        wfc.load_snapshot('middle')
+
+def test_snapshots_are_copies():
+    wfc = CheckerGen((4, 4), mode='bitset', seed=0).wfc
+    wfc.save_snapshot('empty')
+    assert wfc.solve()
+    wfc.save_snapshot('solved')
+    wfc.load_snapshot('empty')
+    assert (wfc.result() < 0).all()
+    wfc.load_snapshot('solved')
+    assert (wfc.result() >= 0).all()
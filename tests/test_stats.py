@@ -0,0 +1,31 @@
+import pytest
+import wfc_kernel
+from sudoku import Sudoku
+from checkerboard_wfc import CheckerGen
+
+@pytest.mark.parametrize('seed', range(3))
+def test_backtracking_stats_are_consistent(seed):
+    gen = Sudoku(16, seed=seed, backtrack_budget=64, stats=True)
+    assert gen.wfc.solve(200)
+    stats = gen.wfc.stats
+    # every backtrack undoes a contradiction, a failed refutation is one too
+    assert stats['backtracks'] == gen.wfc.backtracks
+    assert stats['contradictions'] >= stats['backtracks']
+    assert stats['restarts'] == gen.wfc.restarts
+    assert stats['collapses'] >= 16 * 16
+
+@pytest.mark.parametrize('options', [{'mode': 'classic'}, {'mode': 'bitset', 'kernel': 'python'}])
+def test_observers_see_every_collapse(options):
+    gen = CheckerGen((5, 5), seed=0, **options)
+    seen = []
+    gen.wfc.observe('collapse', lambda name, state: seen.append((name, state)))
+    gen.wfc.solve()
+    assert len(seen) == gen.wfc.stats['collapses']
+    assert gen.wfc.stats['solved']
+
+@pytest.mark.skipif(wfc_kernel.numba is None, reason="numba is not installed")
+def test_stats_warn_that_they_skip_the_kernel():
+    gen = CheckerGen((5, 5), mode='bitset', kernel='numba', seed=0, stats=True)
+    with pytest.warns(RuntimeWarning, match="numba"):
+        assert gen.wfc.solve()
+    assert gen.wfc.stats['collapses'] > 0
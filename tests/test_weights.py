@@ -0,0 +1,45 @@
+import random
+import numpy as np
+import pytest
+from cWFC import WaveFunctionCollapse
+
+WEIGHTS = {'a': 0, 'b': 1, 'c': 3}
+ANYTHING = {state: list(WEIGHTS) for state in WEIGHTS}
+SOLVERS = [{'mode': 'classic'}, {'mode': 'bitset'}, {'mode': 'bitset', 'heuristic': 'entropy'}]
+
+def loose_nodes(count:int, **wfc_options) -> WaveFunctionCollapse:
+    # nodes without edges, so every collapse is one independent weighted draw
+    wfc = WaveFunctionCollapse(list(WEIGHTS), ANYTHING, weights=WEIGHTS, seed=0, **wfc_options)
+    wfc.add_nodes(count)
+    if wfc.mode == 'bitset':
+        wfc.save_initial()
+    return wfc
+
+def frequencies(states:np.ndarray) -> np.ndarray:
+    return np.bincount(states.ravel(), minlength=len(WEIGHTS)) / states.size
+
+@pytest.mark.parametrize('options', SOLVERS)
+def test_draws_follow_the_weights(options):
+    random.seed(0)
+    wfc = loose_nodes(4000, **options)
+    assert wfc.solve()
+    # the frequency of c over 4000 draws has a standard deviation of about 0.007
+    assert frequencies(wfc.result()) == pytest.approx([0, 0.25, 0.75], abs=0.03)
+
+def test_batched_draws_follow_the_weights():
+    wfc = loose_nodes(400, mode='bitset')
+    assert frequencies(wfc.solve_many(10, seeds=range(10), batched=True)) == pytest.approx([0, 0.25, 0.75], abs=0.03)
+
+@pytest.mark.parametrize('options', SOLVERS)
+def test_weight_zero_is_picked_when_nothing_else_is_left(options):
+    wfc = WaveFunctionCollapse(list(WEIGHTS), ANYTHING, weights=WEIGHTS, seed=0, **options)
+    wfc.addNode('x', ('a',))
+    wfc.addNode('y', ('a', 'b'))
+    if wfc.mode == 'bitset':
+        wfc.save_initial()
+    assert wfc.solve()
+    assert wfc.result().tolist() == [0, 1]
+
+def test_negative_weights_are_rejected():
+    with pytest.raises(ValueError):
+        WaveFunctionCollapse(list(WEIGHTS), ANYTHING, weights={'a': -1})
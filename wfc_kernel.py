@@ -0,0 +1,189 @@
+import numpy as np
+
+# the solve loop of the bitset mode (neighbor propagation, count heuristic, uniform draws, no backtracking) as plain
+# loops over the solver's integer arrays, compiled with numba when it is installed. It replays the python solver
+# step for step: the same bucket queue arrays, the same order of neighbor updates, and the same draws, as
+# random.Random is a Mersenne Twister whose state is handed in and handed back, so both solvers give the same
+# result for the same seed. Without numba the functions still run, only as slow as their loops are.
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+MT_N = 624
+MT_M = 397
+ONE = np.uint64(1)
+
+def _twist(mt:np.ndarray):
+    # regenerate the 624 words of Mersenne Twister state, as genrand_uint32 of CPython's _random module
+    for i in range(MT_N):
+        y = (mt[i] & 0x80000000) | (mt[(i + 1) % MT_N] & 0x7fffffff)
+        value = mt[(i + MT_M) % MT_N] ^ (y >> 1)
+        if y & 1:
+            value ^= 0x9908b0df
+        mt[i] = value
+
+def _genrand(mt:np.ndarray, pos:int) -> 'tuple[int,int]':
+    if pos >= MT_N:
+        _twist(mt)
+        pos = 0
+    y = mt[pos]
+    y ^= y >> 11
+    y ^= (y << 7) & 0x9d2c5680
+    y ^= (y << 15) & 0xefc60000
+    y ^= y >> 18
+    return y & 0xffffffff, pos + 1
+
+def _randbelow(mt:np.ndarray, pos:int, n:int) -> 'tuple[int,int]':
+    # random.Random.randrange(n) for 0 < n < 2 ** 32: getrandbits(n.bit_length()) until it is below n
+    k = 0
+    while n >> k:
+        k += 1
+    while True:
+        value, pos = _genrand(mt, pos)
+        value >>= 32 - k
+        if value < n:
+            return value, pos
+
+def _popcount(word) -> int:
+    count = 0
+    while word:
+        word &= word - ONE
+        count += 1
+    return count
+
+def _row_count(rows:np.ndarray, row:int) -> int:
+    count = 0
+    for w in range(rows.shape[1]):
+        count += _popcount(rows[row, w])
+    return count
+
+def _unlink(node:int, heads:np.ndarray, next_ids:np.ndarray, prev_ids:np.ndarray, buckets:np.ndarray):
+    next_id = next_ids[node]
+    prev_id = prev_ids[node]
+    if prev_id >= 0:
+        next_ids[prev_id] = next_id
+    else:
+        heads[buckets[node]] = next_id
+    if next_id >= 0:
+        prev_ids[next_id] = prev_id
+    buckets[node] = -1
+
+def _link(node:int, bucket:int, heads:np.ndarray, next_ids:np.ndarray, prev_ids:np.ndarray, buckets:np.ndarray):
+    head = heads[bucket]
+    next_ids[node] = head
+    prev_ids[node] = -1
+    if head >= 0:
+        prev_ids[head] = node
+    heads[bucket] = node
+    buckets[node] = bucket
+
+def solve(domains:np.ndarray, collapsed_state:np.ndarray, priority:np.ndarray, offsets:np.ndarray, indices:np.ndarray,
+          arc_kinds:np.ndarray, allow_masks:np.ndarray, heads:np.ndarray, next_ids:np.ndarray, prev_ids:np.ndarray,
+          buckets:np.ndarray, size:int, snap_domains:np.ndarray, snap_collapsed:np.ndarray, snap_heads:np.ndarray,
+          snap_next:np.ndarray, snap_prev:np.ndarray, snap_buckets:np.ndarray, snap_size:int, mt:np.ndarray, pos:int,
+          restarts:int, max_restarts:int, max_collapses:int) -> 'tuple[int,int,int,int]':
+    # collapse and propagate until the queue is empty, restarting from the snapshot arrays on a contradiction;
+    # arc_kinds is empty for unlabelled graphs, max_restarts and max_collapses are -1 for no limit. Returns (status,
+    # restarts, queue size, Mersenne Twister position): status 1 when solved, 0 when out of restarts, 2 after
+    # max_collapses collapses (calling again carries on where it stopped) and -1 when a queued node had no state
+    # left to draw from.
+    num_states = heads.shape[0] - 1
+    num_words = domains.shape[1]
+    max_degree = 0
+    for node in range(offsets.shape[0] - 1):
+        max_degree = max(max_degree, offsets[node + 1] - offsets[node])
+    changed_ids = np.empty(max_degree, dtype=np.int64)
+    changed_rows = np.empty((max_degree, num_words), dtype=np.uint64)
+    collapses = 0
+    while size > 0:
+        if collapses == max_collapses:
+            return 2, restarts, size, pos
+        collapses += 1
+        node = -1
+        for bucket in range(num_states + 1):
+            if heads[bucket] >= 0:
+                node = heads[bucket]
+                break
+        _unlink(node, heads, next_ids, prev_ids, buckets)
+        size -= 1
+
+        # uniform draw among the remaining states, in the order of their indices
+        count = _row_count(domains, node)
+        if count == 0:
+            return -1, restarts, size, pos
+        pick, pos = _randbelow(mt, pos, count)
+        state = 0
+        for w in range(num_words):
+            word = domains[node, w]
+            word_count = _popcount(word)
+            if pick < word_count:
+                for _ in range(pick):
+                    word &= word - ONE
+                state = w * 64 + _popcount(word ^ (word - ONE)) - 1
+                break
+            pick -= word_count
+        for w in range(num_words):
+            domains[node, w] = 0
+        domains[node, state // 64] = ONE << np.uint64(state % 64)
+        collapsed_state[node] = state
+
+        # every new neighbor row is taken from the old rows before any is written, as one numpy AND does
+        changed = 0
+        for arc in range(offsets[node], offsets[node + 1]):
+            nb = indices[arc]
+            if collapsed_state[nb] >= 0:
+                continue
+            kind = arc_kinds[arc] if arc_kinds.shape[0] else 0
+            if changed > 0 and changed_ids[changed - 1] == nb:
+                # a parallel arc of another kind (rows are sorted, so it follows the first one): both restrict nb
+                for w in range(num_words):
+                    changed_rows[changed - 1, w] &= allow_masks[kind, state, w]
+                continue
+            differs = False
+            for w in range(num_words):
+                row = domains[nb, w] & allow_masks[kind, state, w]
+                changed_rows[changed, w] = row
+                if row != domains[nb, w]:
+                    differs = True
+            if differs:
+                changed_ids[changed] = nb
+                changed += 1
+        contradiction = False
+        for i in range(changed):
+            for w in range(num_words):
+                domains[changed_ids[i], w] = changed_rows[i, w]
+            if _row_count(changed_rows, i) == 0:
+                contradiction = True
+        if not contradiction:
+            for i in range(changed):
+                nb = changed_ids[i]
+                bucket = max(min(_row_count(changed_rows, i) + priority[nb], num_states), 0)
+                if bucket != buckets[nb]:
+                    _unlink(nb, heads, next_ids, prev_ids, buckets)
+                    _link(nb, bucket, heads, next_ids, prev_ids, buckets)
+            continue
+
+        if max_restarts >= 0 and restarts >= max_restarts:
+            return 0, restarts, size, pos
+        restarts += 1
+        domains[:snap_domains.shape[0]] = snap_domains
+        collapsed_state[:snap_collapsed.shape[0]] = snap_collapsed
+        heads[:] = snap_heads
+        next_ids[:snap_next.shape[0]] = snap_next
+        prev_ids[:snap_prev.shape[0]] = snap_prev
+        buckets[:snap_buckets.shape[0]] = snap_buckets
+        size = snap_size
+    return 1, restarts, size, pos
+
+if numba is not None:
+    # solve() calls the helpers through the module globals, so they are compiled first
+    _twist = numba.njit(cache=True)(_twist)
+    _genrand = numba.njit(cache=True)(_genrand)
+    _randbelow = numba.njit(cache=True)(_randbelow)
+    _popcount = numba.njit(cache=True)(_popcount)
+    _row_count = numba.njit(cache=True)(_row_count)
+    _unlink = numba.njit(cache=True)(_unlink)
+    _link = numba.njit(cache=True)(_link)
+    solve = numba.njit(cache=True)(solve)